@@ -0,0 +1,106 @@
+"""
+Benchmark the per-row overhead of the task envelope.
+
+Compares the envelope every record is wrapped in by `InputStream.create_task` with the previous one, a
+regular dataclass with a fresh `uuid.uuid4()` id per row, in time and in memory per envelope.
+
+    python benchmarks/bench_envelope.py --rows 1000000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from py_async import __version__  # noqa: E402
+from py_async.streams.core import InputStream, TaskStatus  # noqa: E402
+
+
+@dataclass
+class LegacyTaskDefinition:
+    input_stream_id: uuid.UUID
+    data: Dict[str, Any]
+    status: TaskStatus = TaskStatus.NOTSTARTED
+    id: uuid.UUID = uuid.uuid4()
+
+
+class LegacyStream:
+    def __init__(self):
+        self._id = uuid.uuid4()
+
+    def create_task(self, message: Any) -> LegacyTaskDefinition:
+        return LegacyTaskDefinition(
+            id=uuid.uuid4(),
+            input_stream_id=self._id,
+            data=message,
+        )
+
+
+class NullStream(InputStream):
+    def init_stream(self):
+        return
+
+    def __next__(self):
+        raise StopIteration
+
+
+def measure(stream: Any, rows: int, repeat: int) -> dict:
+    record = {'a': 1}
+    create_task = stream.create_task
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rows):
+            create_task(record)
+        best = min(best, time.perf_counter() - start)
+    sample = min(rows, 100000)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [create_task(record) for _ in range(sample)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Do not count the list holding the envelopes
+    per_row = (after - before - sys.getsizeof(tasks)) / sample
+    return {'ns_per_row': best / rows * 1e9, 'bytes_per_row': per_row}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', type=str, default=None, help='Write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = {
+        'legacy': measure(LegacyStream(), args.rows, args.repeat),
+        'current': measure(NullStream(), args.rows, args.repeat),
+    }
+    for name, result in results.items():
+        print(f"{name:>8}: {result['ns_per_row']:.0f} ns/row, {result['bytes_per_row']:.0f} bytes/row",
+              file=sys.stderr)
+
+    report = {
+        'benchmark': 'envelope',
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'rows': args.rows,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
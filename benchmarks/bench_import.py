@@ -0,0 +1,115 @@
+"""
+Benchmark the import time of the py_async modules.
+
+Imports every module in a fresh interpreter with `python -X importtime`, and reports the best
+cumulative import time over `--repeat` runs, the slowest modules it imports, and which of the heavy
+backends that should only load once a stream needs them (s3fs, ijson, pyarrow.parquet, ...) were
+imported anyway. With `--max-ms`, exits with an error when a module takes longer than that to import
+or imports one of those backends, so it can run in CI.
+
+    python benchmarks/bench_import.py --repeat 5 --max-ms 300 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from py_async import __version__  # noqa: E402
+
+MODULES = [
+    'py_async.streams.core',
+    'py_async.streams.input',
+    'py_async.streams.output',
+    'py_async.worker',
+    'py_async.pipeline',
+    'py_async.cmd',
+]
+# Backends that are only needed by some streams or filesystems, and must be imported lazily
+LAZY_MODULES = [
+    's3fs',
+    'aiobotocore',
+    'botocore',
+    'aiohttp',
+    'ijson',
+    'pyarrow.parquet',
+    'pyarrow.dataset',
+    'pyarrow.compute',
+    'pyarrow.csv',
+]
+
+
+def import_times(module: str) -> Dict[str, Dict[str, int]]:
+    """Self and cumulative import time in microseconds of every module imported by `import module`."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = {'self': int(self_us), 'cumulative': int(cumulative_us)}
+    return times
+
+
+def measure(module: str, repeat: int, top: int) -> dict:
+    runs = [import_times(module) for _ in range(repeat)]
+    best = min(runs, key=lambda times: times[module]['cumulative'])
+    slowest = sorted(best.items(), key=lambda item: item[1]['self'], reverse=True)[:top]
+    return {
+        'ms': best[module]['cumulative'] / 1000,
+        'modules': len(best),
+        'slowest': {name: times['self'] / 1000 for name, times in slowest},
+        'lazy_imported': [name for name in LAZY_MODULES if name in best],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest imports to report per module')
+    parser.add_argument('--max-ms', type=float, default=None, help='Fail when a module takes longer to import')
+    parser.add_argument('--output', type=str, default=None, help='Write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = {}
+    failures: List[str] = []
+    for module in args.modules:
+        result = results[module] = measure(module, args.repeat, args.top)
+        print(f"{module:>24}: {result['ms']:.1f} ms, {result['modules']} modules", file=sys.stderr)
+        if result['lazy_imported']:
+            failures.append(f"{module} imports {', '.join(result['lazy_imported'])}")
+        if args.max_ms is not None and result['ms'] > args.max_ms:
+            failures.append(f"{module} takes {result['ms']:.1f} ms to import")
+
+    report = {
+        'benchmark': 'import',
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if args.max_ms is not None and failures:
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark the stream/worker pipeline with the loopback runner.
+
+Generates synthetic parquet, CSV, JSON, JSON Lines and Arrow inputs, runs every input format -> passthrough worker ->
+output format combination for each number of workers and queue size, and writes one JSON result
+per run (rows/sec, peak RSS and per-stage times) so results can be compared between releases.
+
+Every run happens in its own subprocess so that peak RSS is measured per run.
+
+    python benchmarks/bench_pipeline.py --rows 100000 --columns 10 --workers 1 8 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from py_async import __version__  # noqa: E402
+
+FORMATS = ['parquet', 'csv', 'json', 'jsonl', 'arrow']
+
+
+def make_table(rows: int, columns: int) -> pa.Table:
+    data = {}
+    for i in range(columns):
+        if i % 3 == 0:
+            data[f'int_{i}'] = pa.array(range(rows), pa.int64())
+        elif i % 3 == 1:
+            # Not a whole number in the first row, so one-row type inference sees a float
+            data[f'float_{i}'] = pa.array((r + 0.25 for r in range(rows)), pa.float64())
+        else:
+            data[f'str_{i}'] = pa.array((f'value {r}' for r in range(rows)), pa.string())
+    return pa.table(data)
+
+
+def generate(directory: str, rows: int, columns: int) -> dict:
+    table = make_table(rows, columns)
+    paths = {fmt: os.path.join(directory, f'input_{rows}x{columns}.{fmt}') for fmt in FORMATS}
+    pq.write_table(table, paths['parquet'])
+    pacsv.write_csv(table, paths['csv'])
+    with open(paths['json'], 'w') as f:
+        f.write('[')
+        for i, batch in enumerate(table.to_batches()):
+            for j, row in enumerate(batch.to_pylist()):
+                if i or j:
+                    f.write(',')
+                f.write(json.dumps(row))
+        f.write(']')
+    with open(paths['jsonl'], 'w') as f:
+        for row in table.to_pylist():
+            f.write(json.dumps(row) + '\n')
+    with pa.ipc.new_file(paths['arrow'], table.schema) as writer:
+        writer.write_table(table)
+    return paths
+
+
+def run_single(config: dict) -> dict:
+    from py_async.cmd import loopback
+
+    start = time.perf_counter()
+    snapshot = loopback(config['input'], config['output'], config['input_format'], config['output_format'],
+                        num_workers=config['workers'], maxsize=config['queue_size'])
+    elapsed = time.perf_counter() - start
+    rows = snapshot['rows'].get('output', 0)
+    return {
+        **config,
+        'rows': rows,
+        'complete': rows == config['expected_rows'],
+        'seconds': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed > 0 else 0.0,
+        # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024),
+        'stage_seconds': {k: v['sum'] for k, v in snapshot['latency'].items()},
+        'stage_rows_per_sec': snapshot['rows_per_sec'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000])
+    parser.add_argument('--columns', type=int, nargs='+', default=[10])
+    parser.add_argument('--input-formats', nargs='+', default=FORMATS, choices=FORMATS)
+    parser.add_argument('--output-formats', nargs='+', default=FORMATS, choices=FORMATS)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--queue-sizes', type=int, nargs='+', default=[1024])
+    parser.add_argument('--output', type=str, default=None, help='Write results to this file instead of stdout')
+    parser.add_argument('--single', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        json.dump(run_single(json.loads(args.single)), sys.stdout)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            for columns in args.columns:
+                paths = generate(directory, rows, columns)
+                for input_format in args.input_formats:
+                    for output_format in args.output_formats:
+                        for workers in args.workers:
+                            for queue_size in args.queue_sizes:
+                                config = {
+                                    'input': paths[input_format],
+                                    'output': os.path.join(directory, f'output.{output_format}'),
+                                    'input_format': input_format,
+                                    'output_format': output_format,
+                                    'columns': columns,
+                                    'expected_rows': rows,
+                                    'workers': workers,
+                                    'queue_size': queue_size,
+                                }
+                                out = subprocess.run([sys.executable, __file__, '--single', json.dumps(config)],
+                                                     check=True, capture_output=True, text=True)
+                                result = json.loads(out.stdout)
+                                del result['input'], result['output']
+                                print(f"{input_format:>7} -> {output_format:<7} rows={rows} columns={columns} "
+                                      f"workers={workers} queue={queue_size}: {result['rows_per_sec']:.0f} rows/s, "
+                                      f"{result['peak_rss_bytes'] / 2 ** 20:.0f} MiB"
+                                      f"{'' if result['complete'] else ' (INCOMPLETE)'}", file=sys.stderr)
+                                results.append(result)
+
+    report = {
+        'benchmark': 'pipeline',
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import math
+from typing import Any, Optional
+
+log = logging.getLogger(__name__)
+
+# How fast the latency baseline follows the observed latency upwards, per interval
+BASELINE_DRIFT = 0.01
+
+
+class Autoscaler:
+    """
+    Adjusts the number of consumer tasks of a worker while it runs, with additive increase and
+    multiplicative decrease (AIMD).
+
+    Every `interval` seconds it looks at the `process` calls finished since the last look. When the
+    share of FAILED and ERROR results exceeds `max_error_rate`, or their mean latency exceeds
+    `target_latency` (by default `latency_tolerance` times the lowest latency seen, which slowly
+    follows the observed latency), the downstream service is taken to be overloaded and the number
+    of workers is multiplied by `decrease`. Otherwise, while tasks are waiting on the input queue,
+    `increase` workers are added. Intervals with fewer than `min_samples` calls are skipped.
+    The number of workers stays within [min_workers, max_workers] and is exported as the
+    `workers` gauge.
+    """
+
+    def __init__(self, min_workers: int = 1, max_workers: int = 64, interval: float = 1.0,
+                 target_latency: Optional[float] = None, latency_tolerance: float = 2.0,
+                 max_error_rate: float = 0.05, increase: int = 1, decrease: float = 0.5,
+                 min_samples: int = 10):
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError(f'Expected 1 <= min_workers <= max_workers, got {min_workers} and {max_workers}')
+        if not 0 < decrease < 1:
+            raise ValueError(f'decrease must be in (0, 1), got {decrease}')
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self._interval = interval
+        self._target_latency = target_latency
+        self._latency_tolerance = latency_tolerance
+        self._max_error_rate = max_error_rate
+        self._increase = increase
+        self._decrease = decrease
+        self._min_samples = min_samples
+        self._baseline: Optional[float] = None
+
+    def clamp(self, num_workers: int) -> int:
+        return min(max(num_workers, self.min_workers), self.max_workers)
+
+    def decide(self, num_workers: int, latency: float, error_rate: float, backlog: int) -> int:
+        """Return the number of workers to run next, given the mean latency and error rate of an interval."""
+        if self._baseline is None:
+            self._baseline = latency
+        else:
+            self._baseline = min(latency, self._baseline + (latency - self._baseline) * BASELINE_DRIFT)
+        limit = self._target_latency if self._target_latency is not None else self._baseline * self._latency_tolerance
+        if error_rate > self._max_error_rate or latency > limit:
+            return self.clamp(math.floor(num_workers * self._decrease))
+        if backlog > 0:
+            return self.clamp(num_workers + self._increase)
+        return num_workers
+
+    async def run(self, worker: Any):
+        metrics = worker.metrics
+        num_workers = self.clamp(worker.num_workers)
+        worker.scale(num_workers)
+        metrics.set_gauge('workers', num_workers)
+        count, total, rows, errors = self._totals(metrics)
+        while True:
+            await asyncio.sleep(self._interval)
+            if metrics.process.count - count < self._min_samples:
+                continue
+            _count, _total, _rows, _errors = self._totals(metrics)
+            # Latency is per process call (a whole batch for a BatchWorker), errors are per record
+            latency = (_total - total) / (_count - count)
+            error_rate = (_errors - errors) / max(_rows - rows, 1)
+            count, total, rows, errors = _count, _total, _rows, _errors
+            backlog = worker.queue.qsize()
+            num_workers = self.decide(worker.num_workers, latency, error_rate, backlog)
+            if num_workers != worker.num_workers:
+                log.info(f'Scaling from {worker.num_workers} to {num_workers} workers: latency {latency:.4f}s, '
+                         f'error rate {error_rate:.3f}, backlog {backlog}')
+                worker.scale(num_workers)
+            metrics.set_gauge('workers', num_workers)
+
+    @staticmethod
+    def _totals(metrics: Any):
+        errors = metrics.statuses['FAILED'] + metrics.statuses['ERROR']
+        return metrics.process.count, metrics.process.sum, metrics.rows['process'], errors
@@ -0,0 +1,152 @@
+import datetime
+import decimal
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import pyarrow as pa
+
+log = logging.getLogger(__name__)
+
+
+def _encode_value(obj: Any) -> Any:
+    """JSON-encodable form of the values `json` cannot encode, tagged with their type."""
+    if isinstance(obj, (pa.RecordBatch, pa.Table)):
+        # The string form of Arrow data is a truncated preview, so the whole IPC stream is hashed
+        import pyarrow.ipc as ipc
+        sink = pa.BufferOutputStream()
+        with ipc.new_stream(sink, obj.schema) as writer:
+            writer.write(obj)
+        return [type(obj).__name__, hashlib.blake2b(sink.getvalue(), digest_size=16).hexdigest()]
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return [type(obj).__name__, obj.isoformat()]
+    if isinstance(obj, datetime.timedelta):
+        return ['timedelta', obj.total_seconds()]
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return [type(obj).__name__, str(obj)]
+    if isinstance(obj, (bytes, bytearray)):
+        return ['bytes', obj.hex()]
+    raise TypeError(f'Cannot compute a cache key for {type(obj).__name__} values')
+
+
+def record_key(data: Any, columns: Optional[Sequence[str]] = None) -> str:
+    """
+    Stable hash of a record, or of only its `columns`, independent of key order.
+
+    Records may be JSON values, or `pyarrow.RecordBatch` objects in columnar mode. Raises a
+    TypeError for values that cannot be hashed exactly.
+    """
+    if columns is not None:
+        if isinstance(data, pa.RecordBatch):
+            data = data.select(columns)
+        else:
+            data = {k: data.get(k) for k in columns}
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=_encode_value).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+class ResultCache(ABC):
+    """
+    Base class for caches of `TaskResult` objects keyed by `record_key`.
+
+    Counts hits and misses, and requests that were coalesced with an identical one in flight.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, result: Any):
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[Any]:
+        result = self._get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
+
+    def close(self):
+        pass
+
+
+class MemoryCache(ResultCache):
+    """
+    In-memory cache keeping the `maxsize` most recently used results, each for at most `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = 100_000, ttl: Optional[float] = None):
+        super().__init__()
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+
+    def _get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, result = entry
+        if self._ttl is not None and time.monotonic() - created > self._ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def set(self, key: str, result: Any):
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+
+class SqliteCache(ResultCache):
+    """
+    Persistent cache in a sqlite database, so results survive between runs. Entries older than
+    `ttl` seconds are ignored.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        super().__init__()
+        self._ttl = ttl
+        self._db = sqlite3.connect(path)
+        # Commit every result without waiting for a full fsync each time
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL, value BLOB)')
+        self._db.commit()
+
+    def _get(self, key: str) -> Optional[Any]:
+        row = self._db.execute('SELECT created, value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        created, value = row
+        if self._ttl is not None and time.time() - created > self._ttl:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key: str, result: Any):
+        self._db.execute(
+            'INSERT OR REPLACE INTO results (key, created, value) VALUES (?, ?, ?)',
+            (key, time.time(), pickle.dumps(result)),
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
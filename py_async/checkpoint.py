@@ -0,0 +1,90 @@
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+from py_async.streams.core import _choose_filesystem
+
+log = logging.getLogger(__name__)
+
+
+def _key(position: Any) -> Any:
+    # Positions round-trip through JSON, which turns tuples into lists
+    return tuple(position) if isinstance(position, list) else position
+
+
+class Checkpoint:
+    """
+    Tracks which input records have been written out and periodically persists the input position
+    up to which the output is durable, so that an interrupted run can resume from there.
+
+    Records complete out of order, so besides the position after the last record of the contiguous
+    completed prefix (the watermark) the checkpoint stores the positions of records completed after it.
+    On resume those are skipped, and the output is truncated to the size it had when the checkpoint
+    was written, so every record is written exactly once. The checkpoint is removed after a
+    successful run.
+    """
+
+    def __init__(self, path: str, interval: float = 60.0, resume: bool = True):
+        self._path = path
+        self._fs = _choose_filesystem(path)
+        self._interval = interval
+        self._resume = resume
+        self._pending: Deque[Any] = deque()
+        self._done: Set[Any] = set()
+        self._watermark: Any = None
+        self._rows = 0
+        self._saved = time.monotonic()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Return the saved state if resuming and a checkpoint exists, resetting the tracked positions to it."""
+        if not self._resume or not self._fs.exists(self._path):
+            return None
+        state = json.loads(self._fs.cat_file(self._path))
+        self._watermark = state['watermark'] = _key(state['watermark'])
+        self._done = {_key(p) for p in state['done']}
+        state['done'] = list(self._done)
+        self._rows = state['rows']
+        log.info(f'Resuming from checkpoint `{self._path}` after {self._rows} rows')
+        return state
+
+    def track(self, position: Any):
+        """Register a record, in input order, before it is handed to the workers."""
+        self._pending.append(position)
+
+    def complete(self, position: Any):
+        """Mark a record as written out, or as dropped."""
+        self._rows += 1
+        if self._pending and self._pending[0] == position:
+            self._watermark = self._pending.popleft()
+            while self._pending and self._pending[0] in self._done:
+                self._done.discard(self._pending[0])
+                self._watermark = self._pending.popleft()
+        else:
+            self._done.add(position)
+
+    def due(self) -> bool:
+        return time.monotonic() - self._saved >= self._interval
+
+    def save(self, output_position: Any):
+        """Persist the current state. The output must be durable up to `output_position` already."""
+        # Positions restored from a previous checkpoint are never tracked again, drop them once passed
+        if self._watermark is not None:
+            self._done = {p for p in self._done if p > self._watermark}
+        state = {
+            'watermark': self._watermark,
+            'done': list(self._done),
+            'rows': self._rows,
+            'output_position': output_position,
+            'time': time.time(),
+        }
+        tmp_path = f'{self._path}.tmp'
+        self._fs.pipe_file(tmp_path, json.dumps(state).encode('utf-8'))
+        self._fs.mv(tmp_path, self._path)
+        self._saved = time.monotonic()
+        log.debug(f'Saved checkpoint `{self._path}` after {self._rows} rows')
+
+    def remove(self):
+        if self._fs.exists(self._path):
+            self._fs.rm(self._path)
@@ -1,21 +1,71 @@
 import argparse
+import asyncio
+import itertools
+import json
 import time
 import logging
 import sys
 import os
+from typing import Any, Dict, Optional
 
-from py_async.streams.input import ICsv
-from py_async.streams.output import OCsv
+from py_async.streams.core import FileFormat, InputStream, TaskStatus
+from py_async.streams.input import FILE_STREAMS as INPUT_STREAMS
+from py_async.streams.output import FILE_STREAMS as OUTPUT_STREAMS
+from py_async.worker import Worker, WorkerContext, TaskResult
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
 
-def loopback(input_fn, output_fn, input_format, output_format, start=None, limit=None):
+class PassthroughWorker(Worker):
+    """
+    Worker that returns every record unchanged.
+    """
+
+    def worker_init(self) -> WorkerContext:
+        return WorkerContext(None)
+
+    async def process(self, data: Any, context: WorkerContext) -> TaskResult:
+        return TaskResult(data, TaskStatus.COMPLETED)
+
+
+class SliceStream(InputStream):
+    """
+    Input stream yielding the records of another input stream from `start`, at most `limit` of them.
+    """
+
+    def __init__(self, stream: InputStream, start: Optional[int] = None, limit: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self._stream = stream
+        self._start = start or 0
+        self._limit = limit
+        self._iter = None
+
+    def init_stream(self):
+        self._stream.init_stream()
+        stop = self._start + self._limit if self._limit is not None else None
+        self._iter = itertools.islice(self._stream, self._start, stop)
+
+    def __next__(self):
+        return next(self._iter)
+
+
+def loopback(input_fn, output_fn, input_format, output_format, start=None, limit=None,
+             num_workers: int = 1, maxsize: int = 1024) -> Dict[str, Any]:
     """
     Create input and output streams and a passthrough runner.
+
+    Reads `input_fn`, optionally only `limit` records from record `start`, and writes every record
+    back out to `output_fn`. Returns the metrics snapshot of the run.
     """
-    return None
+    input_stream = INPUT_STREAMS[FileFormat(input_format)](input_fn, maxsize=maxsize)
+    if start is not None or limit is not None:
+        input_stream = SliceStream(input_stream, start, limit, maxsize=maxsize)
+    output_stream = OUTPUT_STREAMS[FileFormat(output_format)](output_fn, force=True)
+
+    worker = PassthroughWorker().input(input_stream).output(output_stream)
+    asyncio.run(worker.run(num_workers))
+    return worker.metrics.snapshot()
 
 
 def loopback_cmd():
@@ -29,16 +79,23 @@ def loopback_cmd():
     parser.add_argument('-s', '--start', type=int, default=-1)
     parser.add_argument('-if', '--input-format', type=str, default="parquet")
     parser.add_argument('-of', '--output-format', type=str, default="parquet")
+    parser.add_argument('-w', '--workers', type=int, default=1)
+    parser.add_argument('-q', '--queue-size', type=int, default=1024)
 
     args = parser.parse_args()
 
-    log.debug(f'Running loopback test with input {args.input} and output {args.output}')
+    input_fn = args.input if args.input.startswith('s3://') else os.path.join(args.dir, args.input)
+    output_fn = args.output if args.output.startswith('s3://') else os.path.join(args.dir, args.output)
+    log.debug(f'Running loopback test with input {input_fn} and output {output_fn}')
     start = args.start if args.start > 0 else None
     limit = args.limit if args.limit > 0 else None
 
     start_time = time.time()
-    loopback(args.input, args.output, args.input_format, args.output_format, start, limit)
+    metrics = loopback(input_fn, output_fn, args.input_format, args.output_format, start, limit,
+                       num_workers=args.workers, maxsize=args.queue_size)
     log.debug(f'Total time : {time.time() - start_time}')
+    json.dump(metrics, sys.stdout)
+    sys.stdout.write('\n')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import random
+from abc import abstractmethod
+from typing import Any, Dict, Optional, Sequence
+
+import aiohttp
+
+from py_async.streams.core import TaskStatus
+from py_async.worker import Worker, WorkerContext, TaskResult
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing on average `rate` acquisitions per second, with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError(f'rate must be positive, got {rate}')
+        self._rate = rate
+        self._burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self._burst
+        self._updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self._updated is not None:
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class HttpWorker(Worker):
+    """
+    Worker calling an HTTP API through a single `aiohttp.ClientSession` shared by all workers.
+
+    Subclasses implement `build_request`, returning the keyword arguments of
+    `aiohttp.ClientSession.request` (at least `method` and `url`), and `parse_response`.
+    The session keeps up to `limit` pooled keep-alive connections in total and `limit_per_host`
+    per host. With `rate`, requests are spaced by a token bucket. Responses with a status in
+    `retry_statuses` and connection errors are retried up to `max_retries` times with exponential
+    backoff and full jitter, honouring `Retry-After`, after which the task is FAILED with the
+    original record as its data. Errors raised by `parse_response`, e.g. by `raise_for_status`,
+    are not retried and fail the task straight away.
+    """
+
+    session: Optional[aiohttp.ClientSession] = None
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 0, keepalive_timeout: float = 30.0,
+                 timeout: float = 60.0, rate: Optional[float] = None, burst: Optional[float] = None,
+                 max_retries: int = 5, backoff: float = 0.5, max_backoff: float = 30.0,
+                 retry_statuses: Sequence[int] = RETRY_STATUSES):
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._timeout = timeout
+        self._rate_limiter = TokenBucket(rate, burst) if rate is not None else None
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._retry_statuses = frozenset(retry_statuses)
+
+    @abstractmethod
+    def build_request(self, data: Any) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def parse_response(self, data: Any, response: aiohttp.ClientResponse) -> TaskResult:
+        pass
+
+    def worker_init(self) -> WorkerContext:
+        return WorkerContext(self.session)
+
+    def create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self._limit,
+            limit_per_host=self._limit_per_host,
+            keepalive_timeout=self._keepalive_timeout,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self._timeout))
+
+    async def process(self, data: Any, context: WorkerContext) -> TaskResult:
+        return await self.request(data, **self.build_request(data))
+
+    async def request(self, data: Any, method: str, url: str, **kwargs) -> TaskResult:
+        error = None
+        retry_after = None
+        for attempt in range(self._max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff_delay(attempt - 1, retry_after))
+            if self._rate_limiter is not None:
+                await self._rate_limiter.acquire()
+            retry_after = None
+            try:
+                response = await self.session.request(method, url, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+                log.debug(f'Request {method} {url} attempt {attempt + 1} failed with {error}')
+                continue
+            async with response:
+                if response.status not in self._retry_statuses:
+                    return await self._parse_response(data, response, method, url)
+                error = f'HTTP {response.status}'
+                retry_after = response.headers.get('Retry-After')
+            log.debug(f'Request {method} {url} attempt {attempt + 1} failed with {error}')
+        log.error(f'Request {method} {url} failed after {self._max_retries + 1} attempts: {error}')
+        return TaskResult(data, TaskStatus.FAILED)
+
+    async def _parse_response(self, data: Any, response: aiohttp.ClientResponse, method: str, url: str) -> TaskResult:
+        # Errors raised while parsing, e.g. by `raise_for_status`, would only come back when retried
+        try:
+            return await self.parse_response(data, response)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.error(f'Request {method} {url} failed with {e!r}')
+            return TaskResult(data, TaskStatus.FAILED)
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        delay = random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def start(self):
+        self.session = self.create_session()
+
+    async def stop(self):
+        await self.session.close()
+        self.session = None
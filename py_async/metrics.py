@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+# Latency bucket upper bounds in seconds, doubling from 10 microseconds to about 84 seconds
+LATENCY_BUCKETS: List[float] = [1e-5 * 2 ** i for i in range(24)]
+
+
+class Histogram:
+    """
+    Fixed bucket histogram. Recording is a single bisect, quantiles are bucket upper bounds.
+    """
+
+    def __init__(self, bounds: Optional[List[float]] = None):
+        self.bounds = bounds if bounds is not None else LATENCY_BUCKETS
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class MetricsCollector:
+    """
+    Collects throughput and latency metrics of a `Worker.run`.
+
+    Per stage it records how many rows passed through and how long each step took: waiting on
+    the input queue (`input_wait`), `process` calls (`process`), putting results on the output
+    queue (`output_put`) and writing them (`output_write`). Results are counted by `TaskStatus`,
+    with unexpected exceptions counted as `ERROR`. Queue depths, and the bytes held by queues with a
+    byte budget, are sampled when a snapshot is taken. Other current values (such as the number of
+    workers) are kept as gauges.
+
+    Listeners added with `add_listener` are called with a snapshot every `interval` seconds while
+    the run is going and once when it finishes. Snapshots can be exported as JSON or in the
+    Prometheus text format.
+    """
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self.input_wait = Histogram()
+        self.process = Histogram()
+        self.output_put = Histogram()
+        self.output_write = Histogram()
+        self.rows: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, int] = defaultdict(int)
+        self.gauges: Dict[str, float] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], Any]] = []
+        self._start = time.perf_counter()
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def watch_queue(self, name: str, queue: asyncio.Queue):
+        self._queues[name] = queue
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], Any]):
+        self._listeners.append(callback)
+
+    def record_input(self, rows: int = 1):
+        self.rows['input'] += rows
+
+    def record_wait(self, seconds: float):
+        self.input_wait.record(seconds)
+
+    def record_process(self, seconds: float, rows: int = 1):
+        self.process.record(seconds)
+        self.rows['process'] += rows
+
+    def record_status(self, status: str):
+        self.statuses[str(status)] += 1
+
+    def record_put(self, seconds: float):
+        self.output_put.record(seconds)
+
+    def record_output(self, seconds: float, rows: int = 1):
+        self.output_write.record(seconds)
+        self.rows['output'] += rows
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._start
+        return {
+            'elapsed': elapsed,
+            'rows': dict(self.rows),
+            'rows_per_sec': {k: v / elapsed if elapsed > 0 else 0.0 for k, v in self.rows.items()},
+            'latency': {
+                'input_wait': self.input_wait.snapshot(),
+                'process': self.process.snapshot(),
+                'output_put': self.output_put.snapshot(),
+                'output_write': self.output_write.snapshot(),
+            },
+            'status': dict(self.statuses),
+            'queue_depth': {k: q.qsize() for k, q in self._queues.items()},
+            'queue_bytes': {k: q.nbytes for k, q in self._queues.items() if hasattr(q, 'nbytes')},
+            'gauges': dict(self.gauges),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, prefix: str = 'py_async') -> str:
+        snapshot = self.snapshot()
+        lines = [f'# TYPE {prefix}_rows_total counter']
+        lines += [f'{prefix}_rows_total{{stage="{k}"}} {v}' for k, v in snapshot['rows'].items()]
+        lines.append(f'# TYPE {prefix}_tasks_total counter')
+        lines += [f'{prefix}_tasks_total{{status="{k}"}} {v}' for k, v in snapshot['status'].items()]
+        lines.append(f'# TYPE {prefix}_queue_depth gauge')
+        lines += [f'{prefix}_queue_depth{{queue="{k}"}} {v}' for k, v in snapshot['queue_depth'].items()]
+        lines.append(f'# TYPE {prefix}_queue_bytes gauge')
+        lines += [f'{prefix}_queue_bytes{{queue="{k}"}} {v}' for k, v in snapshot['queue_bytes'].items()]
+        for name, value in snapshot['gauges'].items():
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {value}')
+        lines.append(f'# TYPE {prefix}_latency_seconds histogram')
+        for stage, histogram in (('input_wait', self.input_wait), ('process', self.process),
+                                 ('output_put', self.output_put), ('output_write', self.output_write)):
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_latency_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{prefix}_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{prefix}_latency_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{prefix}_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        """Call every listener with a fresh snapshot."""
+        if not self._listeners:
+            return
+        snapshot = self.snapshot()
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                log.error(f'Metrics listener {callback} failed with unexpected exception: {e}')
+
+    async def report_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
@@ -0,0 +1,118 @@
+import logging
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Self, Sequence, Tuple
+
+from py_async.metrics import MetricsCollector
+from py_async.streams.core import InputStream, OutputStream, TaskDefinition, TaskStatus
+from py_async.worker import Worker, run_stages
+
+log = logging.getLogger(__name__)
+
+
+class Channel(OutputStream):
+    """
+    Bounded queue connecting two pipeline stages: the output stream of one stage and the input of the next.
+    """
+
+    def __init__(self, maxsize: int = 1024, max_bytes: Optional[int] = None):
+        super().__init__(maxsize=maxsize, max_bytes=max_bytes)
+
+    def init_stream(self):
+        return
+
+    def write(self, record: Any):
+        raise NotImplementedError('Channels are consumed by the next stage')
+
+
+class Pipeline:
+    """
+    Chains `Worker` stages in memory, e.g. fetch -> enrich -> score, without writing in between.
+
+    Every stage runs its own number of workers and hands its COMPLETED tasks to the next stage over a
+    `Channel` of at most `maxsize` tasks. Since output streams are bounded as well, a slow stage or
+    sink holds back all stages before it, down to the input streams. Tasks that did not complete
+    skip the remaining stages and go straight to the output streams. Shutdown drains the stages in
+    order, as `Worker.run` does for a single one.
+
+    Every stage records its own metrics. Use `start`/`stop` of the workers for resources shared by a
+    stage; an `ExecutorWorker` without an executor creates its own process pool.
+    """
+
+    def __init__(self):
+        self._input_streams: List[InputStream] = []
+        self._stages: List[Tuple[Worker, int, int, Optional[int]]] = []
+        self._output_streams: List[OutputStream] = []
+        self._route: Optional[Callable[[TaskDefinition], OutputStream | Sequence[OutputStream]]] = None
+        self.metrics: List[MetricsCollector] = []
+
+    def input(self, *streams: InputStream) -> Self:
+        self._input_streams = list(streams)
+        return self
+
+    def stage(self, worker: Worker, num_workers: int = 1, maxsize: int = 1024, max_bytes: Optional[int] = None) -> Self:
+        """
+        Append a stage running `num_workers` consumers of `worker`, fed by a queue of `maxsize` tasks
+        and, with `max_bytes`, about that many bytes of records.
+        """
+        if num_workers < 1:
+            raise ValueError(f'num_workers must be positive, got {num_workers}')
+        self._stages.append((worker, num_workers, maxsize, max_bytes))
+        return self
+
+    def output(self, *streams: OutputStream,
+               route: Optional[Callable[[TaskDefinition], OutputStream | Sequence[OutputStream]]] = None) -> Self:
+        """Write the results of the last stage to `streams`, see `Worker.output`."""
+        self._output_streams = list(streams)
+        self._route = route
+        return self
+
+    def _connect(self):
+        if not self._input_streams or not self._stages or not self._output_streams:
+            raise ValueError('A pipeline needs input streams, at least one stage and output streams')
+        self._stages[0][0].input(*self._input_streams)
+        for (worker, *_), (next_worker, _, maxsize, max_bytes) in zip(self._stages, self._stages[1:]):
+            channel = Channel(maxsize, max_bytes)
+            next_worker.input(channel)
+            worker.output(channel, *self._output_streams, route=self._forward(channel))
+        self._stages[-1][0].output(*self._output_streams, route=self._route)
+
+    def _forward(self, channel: Channel) -> Callable[[TaskDefinition], OutputStream | Sequence[OutputStream]]:
+        def route(task: TaskDefinition) -> OutputStream | Sequence[OutputStream]:
+            if task.status == TaskStatus.COMPLETED:
+                return channel
+            if self._route is not None:
+                return self._route(task)
+            return self._output_streams
+        return route
+
+    async def run(self, executor: Optional[Executor] = None):
+        """Run every stage until all input has been processed. Returns whether the run succeeded."""
+        for worker, *_ in self._stages:
+            if worker._checkpoint is not None:
+                raise ValueError('Checkpoints are not supported in pipelines')
+        if any(stream.ordered for stream in self._output_streams):
+            raise ValueError('Ordered output is not supported in pipelines')
+        self._connect()
+        self.metrics = []
+        for worker, *_ in self._stages:
+            worker.prepare(executor)
+            self.metrics.append(worker.metrics)
+        # The last stage accounts for the writes, whichever stage the task comes from
+        for stream in self._output_streams:
+            stream.metrics = self._stages[-1][0].metrics
+        started = []
+        try:
+            for worker, *_ in self._stages:
+                await worker.start()
+                started.append(worker)
+            return await run_stages(
+                self._input_streams,
+                [(worker, num_workers) for worker, num_workers, *_ in self._stages],
+                self._output_streams,
+                [worker.metrics.report_periodically() for worker, *_ in self._stages],
+            )
+        finally:
+            for worker in reversed(started):
+                await worker.stop()
+            for worker, *_ in self._stages:
+                worker.finish()
@@ -1,16 +1,24 @@
+import collections
+import itertools
 import logging
 import asyncio
+import os
+import sys
+import threading
+import time
 import uuid
 import decimal
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Iterator, Set, Tuple
 
 import pyarrow as pa
-import s3fs
 from fsspec.implementations.local import LocalFileSystem
 from strenum import StrEnum
 
+from py_async.metrics import MetricsCollector
+from py_async.streams.upload import BackgroundWriter, open_background_writer
+
 log = logging.getLogger(__name__)
 
 """
@@ -48,19 +56,95 @@ async def cancel_all(tasks):
             log.debug(f'Awaited task {task.get_name()}')
 
 
+class FileFormat(StrEnum):
+    PARQUET = 'parquet'
+    CSV = 'csv'
+    JSON = 'json'
+    JSONL = 'jsonl'
+    ARROW = 'arrow'
+
+
 class TaskStatus(StrEnum):
     NOTSTARTED = 'NOTSTARTED'
     INPROGRESS = 'INPROGRESS'
     COMPLETED = 'COMPLETED'
     FAILED = 'FAILED'
+    # Placeholder for a task that will not reach an ordered output stream
+    DROPPED = 'DROPPED'
 
 
-@dataclass
+@dataclass(slots=True)
 class TaskDefinition:
+    """
+    Envelope of a record on its way through the queues. `id` is the sequence number of the record in
+    its input stream, increasing from 0 in input order.
+    """
+
     input_stream_id: uuid.UUID
     data: Dict[str, Any]
     status: TaskStatus = TaskStatus.NOTSTARTED
-    id: uuid.UUID = uuid.uuid4()
+    id: int = 0
+    # Position of the record in its input stream, only set when the stream tracks positions
+    offset: Any = None
+
+
+def estimate_size(obj: Any) -> int:
+    """
+    Estimate the memory used by a record: `nbytes` for Arrow data, and `sys.getsizeof` of the object
+    and, recursively, of the items of dicts, lists and tuples. Tasks are measured by their data.
+    """
+    if isinstance(obj, TaskDefinition):
+        return estimate_size(obj.data)
+    if isinstance(obj, (pa.RecordBatch, pa.Table, pa.Array, pa.ChunkedArray)):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += sys.getsizeof(k) + estimate_size(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            size += estimate_size(v)
+    return size
+
+
+class ByteBudgetQueue(asyncio.Queue):
+    """
+    Queue bounded by the estimated size of its items in bytes, besides the usual `maxsize` item count.
+
+    Putting blocks while the items in the queue take up `max_bytes` or more, so the budget is
+    exceeded by at most one item, and an item larger than the budget still fits in an empty queue.
+    Item sizes are measured once, by `estimator`, when they are put. `nbytes` is the current usage.
+    """
+
+    def __init__(self, max_bytes: int, maxsize: int = 0, estimator: Callable[[Any], int] = estimate_size):
+        super().__init__(maxsize)
+        if max_bytes <= 0:
+            raise ValueError(f'max_bytes must be positive, got {max_bytes}')
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._estimator = estimator
+        self._sizes = collections.deque()
+
+    def full(self) -> bool:
+        return super().full() or (self.nbytes >= self.max_bytes and not self.empty())
+
+    def _put(self, item: Any):
+        size = self._estimator(item)
+        self._sizes.append(size)
+        self.nbytes += size
+        super()._put(item)
+
+    def _get(self) -> Any:
+        self.nbytes -= self._sizes.popleft()
+        return super()._get()
+
+
+def create_queue(maxsize: int = 0, max_bytes: Optional[int] = None,
+                 size_estimator: Optional[Callable[[Any], int]] = None) -> asyncio.Queue:
+    """Queue of at most `maxsize` items (unbounded if 0) and, if given, `max_bytes` estimated bytes."""
+    if max_bytes is None:
+        return asyncio.Queue(maxsize=maxsize)
+    return ByteBudgetQueue(max_bytes, maxsize, size_estimator or estimate_size)
 
 
 class Stream(ABC):
@@ -69,6 +153,8 @@ class Stream(ABC):
     _task: asyncio.Task | None
     _stream: Any
     _schema: Optional[pa.Schema] = None
+    metrics: Optional[MetricsCollector] = None
+    checkpoint: Any = None
 
     def __init__(self):
         self._id = uuid.uuid4()
@@ -82,6 +168,9 @@ class Stream(ABC):
     def init_stream(self):
         pass
 
+    def close(self):
+        pass
+
     def run(self):
         self.init_stream()
         if not self._task:
@@ -94,17 +183,58 @@ class Stream(ABC):
         """The asyncio.Queue that the Stream uses to communicate with the worker."""
         return self._queue
 
+
 def _choose_filesystem(path: str):
     if path.startswith('s3://'):
+        # s3fs pulls in aiobotocore and botocore, which take long to import
+        import s3fs
         return s3fs.S3FileSystem()
     else:
         return LocalFileSystem()
 
 
+def shard_range(start: int, end: int, shard_index: int, num_shards: int) -> Tuple[int, int]:
+    """Split [start, end) into `num_shards` contiguous ranges and return the one for `shard_index`."""
+    size = end - start
+    return start + size * shard_index // num_shards, start + size * (shard_index + 1) // num_shards
+
+
 class InputStream(Stream, ABC):
-    def __init__(self, *args, maxsize=1024, **kwargs):
+    """
+    Base class for streams that read records and put them on the worker queue.
+
+    `shard_index` and `num_shards` select a deterministic slice of the input, so that
+    `num_shards` processes (e.g. on different nodes) can each read only their own part.
+
+    With `prefetch > 0`, reading and decoding run in a background thread which stays up to
+    `prefetch` chunks of `prefetch_chunk` records (rows, or batches for columnar streams) ahead
+    of the queue, so blocking I/O does not stall the workers on the event loop.
+
+    The queue holds at most `maxsize` tasks and, with `max_bytes`, at most about that many bytes
+    of records as measured by `size_estimator` (see `ByteBudgetQueue`).
+    """
+
+    _shard_index: int = 0
+    _num_shards: int = 1
+    _prefetch: int = 0
+    _prefetch_chunk: int = 256
+    _track_position: bool = False
+    _resume_position: Any = None
+    _skip: Optional[Set[Any]] = None
+
+    def __init__(self, *args, maxsize=1024, max_bytes: int = None, size_estimator: Callable[[Any], int] = None,
+                 shard_index: int = 0, num_shards: int = 1, prefetch: int = 0, prefetch_chunk: int = None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
-        self._queue = asyncio.Queue(maxsize=maxsize)
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f'shard_index must be in [0, {num_shards}), got {shard_index}')
+        self._shard_index = shard_index
+        self._num_shards = num_shards
+        self._prefetch = prefetch
+        if prefetch_chunk is not None:
+            self._prefetch_chunk = prefetch_chunk
+        self._queue = create_queue(maxsize, max_bytes, size_estimator)
+        self._sequence = itertools.count()
 
     def __iter__(self):
         return self
@@ -113,37 +243,186 @@ class InputStream(Stream, ABC):
     def __next__(self) -> Optional[Dict[str, Any]]:
         raise StopIteration
 
-    async def consume(self):
+    @property
+    def position(self) -> Any:
+        """Position just after the last record read, from which `seek` can resume reading."""
+        raise ValueError(f'{type(self).__name__} does not support checkpoints')
+
+    def track_positions(self):
+        """Record the position of every record in its task, see `TaskDefinition.offset`."""
+        # Fails early for streams without positions
+        self.position
+        self._track_position = True
+
+    def seek(self, position: Any, skip: Optional[Set[Any]] = None):
+        """
+        Resume reading after `position` once the stream is initialised, leaving out the records whose
+        position is in `skip`. Enables tracking positions.
+        """
+        self.track_positions()
+        self._resume_position = position
+        self._skip = set(skip) if skip else None
+
+    def create_task(self, message: Any) -> TaskDefinition:
+        # Positional arguments, this runs for every record
+        return TaskDefinition(self._id, message, TaskStatus.NOTSTARTED, next(self._sequence),
+                              self.position if self._track_position else None)
+
+    def iter_tasks(self) -> Iterator[TaskDefinition]:
+        skip = self._skip
         for message in self:
-            await self._queue.put(
-                TaskDefinition(
-                    id=uuid.uuid4(),
-                    input_stream_id=self._id,
-                    data=message,
-                ))
+            # Skipped records do not take a sequence number, which must stay contiguous
+            if skip and self.position in skip:
+                skip.discard(self.position)
+                continue
+            yield self.create_task(message)
+
+    async def consume(self):
+        if self._prefetch > 0:
+            await self._consume_prefetched()
+            return
+        metrics = self.metrics
+        checkpoint = self.checkpoint
+        for task in self.iter_tasks():
+            if checkpoint is not None:
+                checkpoint.track(task.offset)
+            await self._queue.put(task)
+            if metrics is not None:
+                metrics.record_input()
+
+    async def _consume_prefetched(self):
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        # Chunks handed to the loop but not yet put on the worker queue
+        slots = threading.Semaphore(self._prefetch)
+        stop = threading.Event()
+
+        def deliver(chunk):
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return False
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            return True
+
+        def read():
+            try:
+                chunk = []
+                for task in self.iter_tasks():
+                    chunk.append(task)
+                    if len(chunk) >= self._prefetch_chunk:
+                        if not deliver(chunk):
+                            return
+                        chunk = []
+                if chunk:
+                    deliver(chunk)
+            finally:
+                if not stop.is_set():
+                    loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+        reader = loop.run_in_executor(None, read)
+        try:
+            while (chunk := await chunks.get()) is not None:
+                slots.release()
+                for task in chunk:
+                    if self.checkpoint is not None:
+                        self.checkpoint.track(task.offset)
+                    await self._queue.put(task)
+                if self.metrics is not None:
+                    self.metrics.record_input(len(chunk))
+        finally:
+            stop.set()
+        # Propagate any exception raised while reading
+        await reader
 
 
 class OutputStream(Stream, ABC):
-    def __init__(self, queue, *args, **kwargs):
+    """
+    Base class for streams that take finished tasks off their queue and write them out.
+
+    The queue holds at most `maxsize` tasks, and with `max_bytes` at most about that many bytes of
+    results, so a slow output holds back the workers.
+
+    With `ordered=True`, results are written in input order: tasks that finish early wait in a reorder
+    buffer until every task before them has been written. Workers only start tasks less than
+    `reorder_window` ahead of the oldest unwritten one (for a `BatchWorker`, up to a batch more), so a
+    slow task at the head holds back the input instead of growing the buffer. Tasks that never
+    reach the stream are replaced by a `DROPPED` placeholder which is not written.
+    """
+
+    _ordered: bool = False
+    _reorder_window: int = 1024
+
+    def __init__(self, queue: Optional[asyncio.Queue] = None, *args, maxsize: int = 1024, max_bytes: int = None,
+                 size_estimator: Callable[[Any], int] = None, ordered: bool = False, reorder_window: int = None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
-        self._queue = queue
+        self._queue = queue if queue is not None else create_queue(maxsize, max_bytes, size_estimator)
+        self._ordered = ordered
+        if reorder_window is not None:
+            if reorder_window < 1:
+                raise ValueError(f'reorder_window must be positive, got {reorder_window}')
+            self._reorder_window = reorder_window
+        self._next_id = 0
+        self._reorder_buffer: Dict[int, TaskDefinition] = {}
+        self._window_moved = asyncio.Condition()
+
+    @property
+    def ordered(self) -> bool:
+        return self._ordered
 
     @abstractmethod
-    def write(self, message: TaskDefinition):
+    def write(self, record: Any):
         raise NotImplementedError
 
+    async def drain(self):
+        """Wait until buffered output can accept more records."""
+        return
+
+    def save_checkpoint(self):
+        """Save the checkpoint, with the output made durable up to the records completed so far."""
+        self.checkpoint.save(self.flush())
+
+    def abort(self):
+        """Give up on the output after a failed run, without committing what is not durable yet."""
+        self.close()
+
+    def check_resumable(self):
+        """Raise a ValueError unless the stream can `flush` for a checkpoint and `resume` from it."""
+        raise ValueError(f'{type(self).__name__} does not support checkpoints')
+
+    def resume(self, position: Any):
+        """Continue writing at `position`, as returned by `flush`, instead of starting a new output."""
+        raise ValueError(f'{type(self).__name__} does not support checkpoints')
+
+    def flush(self) -> Any:
+        """Make everything written so far durable and return the position of the end of the output."""
+        raise ValueError(f'{type(self).__name__} does not support checkpoints')
+
+    async def admit(self, task_id: int):
+        """Wait until task `task_id` is within the reorder window of an ordered stream."""
+        if task_id < self._next_id + self._reorder_window:
+            return
+        async with self._window_moved:
+            await self._window_moved.wait_for(lambda: task_id < self._next_id + self._reorder_window)
+
     async def consume(self):
+        debug = log.isEnabledFor(logging.DEBUG)
         try:
             while True:
                 td: TaskDefinition = await self._queue.get()
-                if td.status not in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+                if td.status not in (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.DROPPED):
                     log.error(
                         f"OutputStream {self._id} received task {td.id} with {td.status}.")
-                else:
-                    log.info(
+                elif debug:
+                    log.debug(
                         f"OutputStream {self._id} received task {td.id} with {td.status}.")
                     log.debug(f'Result data: {td.data}')
-                self.write(td)
+                if not self._ordered:
+                    await self._write_task(td)
+                elif td.id != self._next_id:
+                    self._reorder_buffer[td.id] = td
+                else:
+                    await self._write_ordered(td)
                 self._queue.task_done()
         except asyncio.CancelledError:
             log.info('Output task cancelled')
@@ -154,29 +433,163 @@ class OutputStream(Stream, ABC):
         finally:
             log.info('Output task finished')
 
+    async def _write_ordered(self, td: TaskDefinition):
+        # `td` is the head, write it and every buffered task following it
+        while td is not None:
+            await self._write_task(td)
+            self._next_id += 1
+            td = self._reorder_buffer.pop(self._next_id, None)
+        async with self._window_moved:
+            self._window_moved.notify_all()
+
+    async def _write_task(self, td: TaskDefinition):
+        if td.status == TaskStatus.DROPPED:
+            return
+        _time = time.perf_counter()
+        self.write(td.data)
+        # Complete the record before the next await, so a cancelled run cannot save it as pending
+        if self.checkpoint is not None:
+            self.checkpoint.complete(td.offset)
+            if self.checkpoint.due():
+                self.save_checkpoint()
+        await self.drain()
+        if self.metrics is not None:
+            self.metrics.record_output(time.perf_counter() - _time)
+
 
 class File(ABC):
+    """
+    Base class for file backed streams.
+
+    Output streams opened with `background_upload=True` write through a `BackgroundWriter`, which
+    hands `part_size` byte parts to background threads (concurrent multipart uploads for S3), so
+    writing does not block the event loop. At most `max_inflight_parts` parts are pending at once.
+    """
+
     _path: str
     _fs: Any
     _file: Any
     _open: bool = False
-
-    def __init__(self, path: str, force: bool = False, file_format: Optional[FileFormat] = None):
+    _force: bool = False
+    _defer_open: bool = False
+    _background_upload: bool = False
+    _part_size: int = 16 << 20
+    _max_inflight_parts: int = 4
+    _upload: Optional[BackgroundWriter] = None
+    _output: Any = None
+
+    def __init__(self, path: str, force: bool = False, file_format: Optional[FileFormat] = None,
+                 background_upload: bool = False, part_size: int = None, max_inflight_parts: int = None,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self._background_upload = background_upload
+        if part_size is not None:
+            self._part_size = part_size
+        if max_inflight_parts is not None:
+            self._max_inflight_parts = max_inflight_parts
         self._path = path
         self._fs = _choose_filesystem(path)
-        if force:
+        self._force = force
+        if not self._defer_open:
+            self.open_file()
+
+    def open_file(self):
+        if self._open:
+            return
+        if self._force:
             if self._fs.exists(self._path):
                 self._fs.rm(self._path)
         self._file = self.open()
+        self._open = True
 
     @abstractmethod
     def open(self) -> Any:
         raise NotImplementedError
 
+    def open_output(self) -> Any:
+        """Open the file for binary writing, through a background writer if enabled."""
+        if not self._background_upload:
+            self._output = self._fs.open(self._path, 'wb')
+        else:
+            self._output = self._upload = open_background_writer(
+                self._fs, self._path, self._part_size, self._max_inflight_parts)
+        return self._output
+
+    def tell(self) -> int:
+        """Bytes written to the file so far, not counting what the stream or its writer still buffer."""
+        if self._output is None or self._output.closed:
+            return 0
+        return self._output.tell()
+
+    async def drain(self):
+        if self._upload is not None:
+            await self._upload.drain()
+
     def close(self):
         if self._open:
             self._file.close()
             self._open = False
+        # Writers such as Parquet's leave the file they write to open
+        if self._output is not None and not self._output.closed:
+            self._output.close()
+
+    def abort(self):
+        """
+        Close the file after a failed run. A background upload is aborted rather than committed, so no
+        partial object appears at the path. Other files keep what was written.
+        """
+        if self._upload is None:
+            self.close()
+            return
+        self._upload.abort()
+        if self._open:
+            self._open = False
+            try:
+                # Writers wrapping the upload, e.g. to write a footer, fail once it is aborted
+                self._file.close()
+            except (ValueError, OSError):
+                pass
 
     def __del__(self):
-        self.close()
+        # Only an explicit close commits the output
+        self.abort()
+
+
+class AppendableFile(File, ABC):
+    """
+    Base class for output files that a resumed run can append to.
+
+    The file is only opened by `init_stream`, so that `resume` can be called first. On resume the
+    file is truncated to the position returned by the `flush` before the checkpoint, dropping
+    anything written after it, and writing continues from there. Only local files can be resumed.
+    """
+
+    _defer_open: bool = True
+    _resume_position: Optional[int] = None
+
+    def resume(self, position: int):
+        self.check_resumable()
+        self._resume_position = position
+
+    def check_resumable(self):
+        if not isinstance(self._fs, LocalFileSystem) or self._background_upload:
+            raise ValueError(f'Cannot checkpoint `{self._path}`, only local files can be appended to')
+
+    def open_file(self):
+        if self._resume_position is not None:
+            # Do not remove the output that is being resumed
+            self._force = False
+        super().open_file()
+
+    def open_output(self) -> Any:
+        if self._resume_position is None:
+            return super().open_output()
+        self._output = self._fs.open(self._path, 'ab')
+        self._output.truncate(self._resume_position)
+        self._output.seek(self._resume_position)
+        return self._output
+
+    def flush(self) -> int:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
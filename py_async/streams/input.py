@@ -1,15 +1,33 @@
+import asyncio
+import collections
 import csv
-import decimal
+import io
+import itertools
+import json
+import posixpath
 import re
 import logging
-import io
-from typing import Any
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
-import ijson
 import pyarrow
-import pyarrow.parquet as pq
+from fsspec.implementations.local import LocalFileSystem
+from fsspec.utils import infer_compression
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from py_async.streams.core import (
+    File, FileFormat, InputStream, PYTYPE_TO_PATYPE, PATYPE_TO_PYTYPE, _choose_filesystem, cancel_all, shard_range,
+)
+
+if TYPE_CHECKING:
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
 
-from py_async.streams.core import File, InputStream, PYTYPE_TO_PATYPE, PATYPE_TO_PYTYPE
+# Readers of the file formats (ijson, pyarrow.parquet, ...) are imported by the streams using them,
+# so that importing this module stays fast, see benchmarks/bench_import.py
 
 log = logging.getLogger(__name__)
 
@@ -23,15 +41,129 @@ def create_iterator(lst):
         yield x
 
 
+def iter_records(batches, columnar: bool = False):
+    """
+    Yield every row of an iterable of RecordBatches as a dict, or the batches themselves when `columnar`.
+    """
+    for batch in batches:
+        if columnar:
+            yield batch
+        else:
+            yield from batch.to_pylist()
+
+
+def align_to_line(file: Any, position: int) -> int:
+    """Return the offset of the first line starting at or after `position` in a binary file."""
+    if position <= 0:
+        return 0
+    file.seek(position - 1)
+    file.readline()
+    return file.tell()
+
+
+def iter_line_blocks(file: Any, chunk_size: int) -> Iterator[List[bytes]]:
+    """
+    Yield the lines of a binary file, newline included, in blocks read `chunk_size` bytes at a time.
+    Unlike `readlines(hint)` this only needs `read`, which fsspec's remote files implement too.
+    """
+    rest = b''
+    while chunk := file.read(chunk_size):
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            rest += chunk
+            continue
+        yield io.BytesIO(rest + chunk[:end]).readlines()
+        rest = chunk[end:]
+    if rest:
+        yield [rest]
+
+
+class ByteRange:
+    """
+    Read-only file object exposing the byte range [start, end) of a binary file.
+    """
+
+    closed = False
+
+    def __init__(self, file: Any, start: int, end: int):
+        self._file = file
+        self._remaining = max(end - start, 0)
+        self._file.seek(start)
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+class LineReader:
+    """
+    Iterate over the decoded lines of a binary file that start within the byte range [start, end).
+
+    A range starting in the middle of a line skips ahead to the next line, and the line running
+    across `end` is read to its end, so adjacent ranges never split or repeat a line.
+    `offset` is the byte position just after the last line returned.
+    """
+
+    def __init__(self, file: Any, start: int = 0, end: Optional[int] = None, encoding: str = 'utf-8'):
+        self._file = file
+        self._start = start
+        self._end = end
+        self._encoding = encoding
+        self.offset = start
+
+    def __iter__(self) -> Iterator[str]:
+        self.offset = align_to_line(self._file, self._start)
+        self._file.seek(self.offset)
+        while self._end is None or self.offset < self._end:
+            line = self._file.readline()
+            if not line:
+                return
+            self.offset += len(line)
+            yield line.decode(self._encoding)
+
+
 class IParquet(File, InputStream):
     """
     Class for reading streams from Parquet files.
+
+    Sharding splits the file by row groups: every shard reads a contiguous range of row groups.
+    With `columnar=True` the stream yields `pyarrow.RecordBatch` slices of at most `batch_size` rows
+    instead of one dict per row, so workers can operate on whole batches without converting to python.
+
+    Only the `columns` given are read and decoded. A `filter`, either a `pyarrow.compute.Expression`
+    or filters in the disjunctive normal form of `pyarrow.parquet.read_table`, skips the row groups
+    whose statistics show they cannot match, and is evaluated by Arrow on the remaining batches
+    before they are turned into records. Filter columns do not need to be among `columns`.
     """
 
     _batch_iter: Any = None
     _record_iter: Any = None
+    _columnar: bool = False
+    _batch_size: int = 65536
+    _columns: Optional[List[str]] = None
+    _filter: Optional['pc.Expression'] = None
+    _fragments: Optional[Dict[int, Any]] = None
+    _position: Tuple[int, int] = (0, 0)
+
+    def __init__(self, *args, columnar: bool = False, batch_size: int = None, columns: Optional[List[str]] = None,
+                 filter: 'pc.Expression | List' = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._columnar = columnar
+        if batch_size is not None:
+            self._batch_size = batch_size
+        self._columns = columns
+        if filter is not None:
+            import pyarrow.compute as pc
+            import pyarrow.parquet as pq
+            self._filter = filter if isinstance(filter, pc.Expression) else pq.filters_to_expression(filter)
 
-    def open(self) -> pyarrow.parquet.ParquetFile:
+    def open(self) -> 'pq.ParquetFile':
+        import pyarrow.parquet as pq
         log.info(f"Reading Parquet file: `{self._path}`")
         return pq.ParquetFile(
             self._path,
@@ -39,32 +171,175 @@ class IParquet(File, InputStream):
         )
 
     def init_stream(self):
-        self._batch_iter = self._file.iter_batches()
-        self._record_iter = create_iterator(next(self._batch_iter).to_pylist())
+        start, end = shard_range(0, self._file.num_row_groups, self._shard_index, self._num_shards)
+        row_groups = range(start, end)
+        if self._filter is not None:
+            row_groups = self._prune_row_groups(row_groups)
+        if self._track_position:
+            self._record_iter = self._iter_positions(row_groups)
+            return
+        if self._filter is None:
+            self._batch_iter = self._file.iter_batches(batch_size=self._batch_size, row_groups=row_groups,
+                                                       columns=self._columns)
+        else:
+            self._batch_iter = itertools.chain.from_iterable(self._iter_row_group(i) for i in row_groups)
+        self._record_iter = iter_records(self._batch_iter, self._columnar)
         return
 
     def __next__(self):
-        row = None
+        return next(self._record_iter)
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        """Row group of the last row (or batch) read, and the number of rows read from it so far."""
+        return self._position
+
+    def _prune_row_groups(self, row_groups: range) -> List[int]:
+        import pyarrow.dataset as pads
+        import pyarrow.fs as pafs
+        # Splitting the file by row group with a filter drops the groups excluded by their statistics
+        filesystem = pafs.PyFileSystem(pafs.FSSpecHandler(self._fs))
+        fragment = pads.ParquetFileFormat().make_fragment(self._path, filesystem=filesystem)
+        self._fragments = {
+            f.row_groups[0].id: f
+            for f in fragment.split_by_row_group(self._filter, schema=self._file.schema_arrow)
+        }
+        kept = [i for i in row_groups if i in self._fragments]
+        log.info(f'Filter on `{self._path}` keeps {len(kept)} of {len(row_groups)} row groups')
+        return kept
+
+    def _iter_row_group(self, row_group: int) -> Iterator[pyarrow.RecordBatch]:
+        if self._filter is None:
+            return self._file.iter_batches(batch_size=self._batch_size, row_groups=[row_group],
+                                           columns=self._columns)
+        batches = self._fragments[row_group].to_batches(schema=self._file.schema_arrow, columns=self._columns,
+                                                        filter=self._filter, batch_size=self._batch_size)
+        # Batches the filter removed every row from are still yielded, empty
+        return (batch for batch in batches if batch.num_rows)
+
+    def _iter_positions(self, row_groups: Iterable[int]):
+        # Row groups are read one at a time, so that a resumed run can start at the right one
+        resume_row_group, resume_rows = self._resume_position or (-1, 0)
+        for row_group in row_groups:
+            if row_group < resume_row_group:
+                continue
+            skip = resume_rows if row_group == resume_row_group else 0
+            rows = 0
+            for batch in self._iter_row_group(row_group):
+                if rows < skip:
+                    skipped = min(skip - rows, batch.num_rows)
+                    rows += skipped
+                    batch = batch.slice(skipped)
+                if batch.num_rows == 0:
+                    continue
+                if self._columnar:
+                    rows += batch.num_rows
+                    self._position = (row_group, rows)
+                    yield batch
+                    continue
+                for record in batch.to_pylist():
+                    rows += 1
+                    self._position = (row_group, rows)
+                    yield record
+
+    def get_columns(self):
+        names = self._columns if self._columns is not None else self._file.schema_arrow.names
+        return {k: v for v, k in enumerate(names)}
+
+    def get_types(self):
+        schema = self._file.schema_arrow
+        names = self._columns if self._columns is not None else schema.names
+        return {k: schema.field(k).type for k in names}
+
+
+class IArrow(File, InputStream):
+    """
+    Class for reading streams from Arrow IPC files, in the file (Feather v2) or the stream format.
+
+    Local files are memory-mapped, so batches are read without copying or decoding. With
+    `columnar=True` the stream yields the `pyarrow.RecordBatch` objects of the file, sliced to at most
+    `batch_size` rows without copying, instead of one dict per row. Files in the file format are
+    sharded by contiguous ranges of record batches; the stream format has no index of its batches,
+    so every shard reads the whole stream and keeps the batches whose index modulo `num_shards`
+    equals `shard_index`.
+    """
+
+    _reader: Any = None
+    _iter = None
+    _columnar: bool = False
+    _batch_size: Optional[int] = None
+    _position: Tuple[int, int] = (0, 0)
+
+    def __init__(self, *args, columnar: bool = False, batch_size: int = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._columnar = columnar
+        self._batch_size = batch_size
+
+    def open(self) -> Any:
+        log.info(f"Reading Arrow file: `{self._path}`")
+        if isinstance(self._fs, LocalFileSystem):
+            return pyarrow.memory_map(self._path, 'r')
+        return self._fs.open(self._path, 'rb')
+
+    def init_stream(self):
+        import pyarrow.ipc as ipc
         try:
-            row = next(self._record_iter)
-        except StopIteration:
-            try:
-                self._record_iter = create_iterator(next(self._batch_iter).to_pylist())
-                row = next(self._record_iter)
-            except StopIteration:
-                raise StopIteration
-        return row
+            self._reader = ipc.open_file(self._file)
+        except pyarrow.ArrowInvalid:
+            # No footer, so this is the stream format
+            self._file.seek(0)
+            self._reader = ipc.open_stream(self._file)
+        self._iter = self._iter_records(self._iter_batches())
+
+    def __next__(self):
+        return next(self._iter)
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        """Index of the record batch of the last row (or batch) read, and the number of rows read from it so far."""
+        return self._position
+
+    def _iter_batches(self) -> Iterator[Tuple[int, pyarrow.RecordBatch]]:
+        resume_batch = self._resume_position[0] if self._resume_position is not None else 0
+        if isinstance(self._reader, pyarrow.ipc.RecordBatchFileReader):
+            start, end = shard_range(0, self._reader.num_record_batches, self._shard_index, self._num_shards)
+            for i in range(max(start, resume_batch), end):
+                yield i, self._reader.get_batch(i)
+            return
+        for i, batch in enumerate(self._reader):
+            if i % self._num_shards == self._shard_index and i >= resume_batch:
+                yield i, batch
+
+    def _iter_records(self, batches: Iterable[Tuple[int, pyarrow.RecordBatch]]):
+        resume_batch, resume_rows = self._resume_position or (-1, 0)
+        for index, batch in batches:
+            rows = resume_rows if index == resume_batch else 0
+            size = self._batch_size or max(batch.num_rows, 1)
+            for offset in range(rows, batch.num_rows, size):
+                chunk = batch.slice(offset, size)
+                if self._columnar:
+                    rows += chunk.num_rows
+                    self._position = (index, rows)
+                    yield chunk
+                    continue
+                for record in chunk.to_pylist():
+                    rows += 1
+                    self._position = (index, rows)
+                    yield record
 
     def get_columns(self):
-        return {k: v for v, k in enumerate(self._file.schema.names)}
+        return {k: v for v, k in enumerate(self._reader.schema.names)}
 
     def get_types(self):
-        return {k: v for k, v in zip(self._file.schema.names, self._file.schema.to_arrow_schema().types)}
+        return {k: v for k, v in zip(self._reader.schema.names, self._reader.schema.types)}
 
 
 class IJson(File, InputStream):
     """
     Class to iterate over JSON files.
+
+    A top-level JSON array cannot be split by bytes, so when sharded every shard parses the whole
+    file and keeps the items whose index modulo `num_shards` equals `shard_index`.
     """
 
     _file = None
@@ -73,28 +348,34 @@ class IJson(File, InputStream):
     _column_types = None
     _first = True
     _first_data = None
+    _index = 0
 
     def open(self) -> Any:
         log.info(f"Reading JSON file: `{self._path}`")
         return self._fs.open(self._path, 'rb')
 
     def init_stream(self):
-        self._iter = ijson.items(self._file, f'item')
+        import ijson
+        self._iter = ijson.items(self._file, f'item', use_float=True)
         self._first_data = next(self._iter)
         self._column_indices = {k: v for v, k in enumerate(self._first_data.keys())}
         self._column_types = {}
         self._column_types = {k: PYTYPE_TO_PATYPE[type(v)] for k, v in self._first_data.items()}
 
     def __next__(self):
-        row = next(self._iter) if not self._first else self._first_data
-        self._first = False
-        ret = {}
-        for k, v in row.items():
-            if isinstance(v, decimal.Decimal):
-                ret[k] = int(v) if v.as_integer_ratio()[1] == 1 else float(v)
-            else:
-                ret[k] = v
-        return ret
+        while True:
+            row = next(self._iter) if not self._first else self._first_data
+            self._first = False
+            index = self._index
+            self._index += 1
+            if index % self._num_shards == self._shard_index and \
+                    (self._resume_position is None or index >= self._resume_position):
+                return row
+
+    @property
+    def position(self) -> int:
+        """Number of items parsed so far, across all shards. ijson cannot seek, so resuming re-parses them."""
+        return self._index
 
     def get_columns(self):
         return self._column_indices
@@ -103,36 +384,119 @@ class IJson(File, InputStream):
         return self._column_types
 
 
+class IJsonLines(File, InputStream):
+    """
+    Class to iterate over JSON Lines (NDJSON) files, one JSON value per line.
+
+    Lines are read `chunk_size` bytes at a time and parsed with orjson when it is installed, or the
+    standard library otherwise. Numbers are parsed as int and float. `compression` is passed on to
+    fsspec, and by default inferred from the file name (e.g. `.gz`). Uncompressed files are sharded
+    by newline-aligned byte ranges like `ICsv`; compressed files cannot be split, so every shard
+    decompresses the whole file and keeps the lines whose index modulo `num_shards` equals
+    `shard_index`. Blank lines are skipped.
+    """
+
+    _iter = None
+    _offset: int = 0
+    _chunk_size: int = 1 << 20
+    _compression: Optional[str] = 'infer'
+
+    def __init__(self, *args, chunk_size: int = None, compression: Optional[str] = 'infer', **kwargs):
+        if chunk_size is not None:
+            self._chunk_size = chunk_size
+        self._compression = compression
+        super().__init__(*args, **kwargs)
+
+    def open(self) -> Any:
+        log.info(f"Reading JSON Lines file: `{self._path}`")
+        if self._compression == 'infer':
+            self._compression = infer_compression(self._path)
+        return self._fs.open(self._path, 'rb', compression=self._compression)
+
+    def init_stream(self):
+        if self._compression is not None:
+            self._iter = self._iter_records(0, None)
+            return
+        start, end = shard_range(0, self._fs.size(self._path), self._shard_index, self._num_shards)
+        if self._resume_position is not None:
+            start = max(start, self._resume_position)
+        self._iter = self._iter_records(start, end)
+
+    def __next__(self):
+        return next(self._iter)
+
+    @property
+    def position(self) -> int:
+        """Byte offset (in the decompressed data) just after the last line read."""
+        return self._offset
+
+    def _iter_records(self, start: int, end: Optional[int]):
+        loads = orjson.loads if orjson is not None else json.loads
+        # Compressed files are always read from the start, skipping the lines of other shards
+        # and, when resuming, those before the resume position
+        compressed = self._compression is not None
+        resume = self._resume_position if compressed and self._resume_position is not None else -1
+        offset = align_to_line(self._file, start)
+        self._file.seek(offset)
+        index = -1
+        for lines in iter_line_blocks(self._file, self._chunk_size):
+            for line in lines:
+                if end is not None and offset >= end:
+                    return
+                offset += len(line)
+                if line.isspace():
+                    continue
+                index += 1
+                if compressed and (index % self._num_shards != self._shard_index or offset <= resume):
+                    continue
+                self._offset = offset
+                yield loads(line)
+
+
 class ICsv(File, InputStream):
     """
     Class to iterate over CSV files.
+
+    Sharding splits the rows after the header into newline-aligned byte ranges, so every shard
+    only reads its own part of the file. Column names and types always come from the start of
+    the file. Quoted values containing newlines are not supported when sharding.
     """
 
     _file = None
     _iter = None
+    _lines = None
     _column_indices = None
     _column_types = None
-    _file_wrapper = None
-    _first = True
-    _first_data = None
 
     def open(self) -> Any:
         log.info(f"Reading CSV file: `{self._path}`")
-        return io.TextIOWrapper(self._fs.open(self._path, 'rb'), encoding='utf-8')
+        return self._fs.open(self._path, 'rb')
 
     def init_stream(self):
-        self._iter = csv.reader(self._file)
+        header_lines = LineReader(self._file)
+        header_iter = csv.reader(header_lines)
         # Read the first row to get the column names
-        column_names = next(self._iter)
+        column_names = next(header_iter)
+        header_end = header_lines.offset
         # Read the second row to get the column types
-        self._first_data = next(self._iter)
+        first_data = next(header_iter)
         # Create a dictionary mapping column names to column indices
         self._column_indices = {column_names[i]: i for i in range(len(column_names))}
-        self._column_types = self._infer_types(self._first_data)
+        self._column_types = self._infer_types(first_data)
+
+        start, end = shard_range(header_end, self._fs.size(self._path), self._shard_index, self._num_shards)
+        if self._resume_position is not None:
+            start = max(start, self._resume_position)
+        self._lines = LineReader(self._file, start, end)
+        self._iter = csv.reader(self._lines)
+
+    @property
+    def position(self) -> int:
+        """Byte offset just after the last row read."""
+        return self._lines.offset if self._lines is not None else 0
 
     def __next__(self):
-        row = next(self._iter) if not self._first else self._first_data
-        self._first = False
+        row = next(self._iter)
         ret = {}
         for k, v in self._column_indices.items():
             if v >= len(row):
@@ -165,3 +529,215 @@ class ICsv(File, InputStream):
                 log.debug(f"Detected string value: {v}")
                 column_types[k] = pyarrow.string()
         return column_types
+
+
+class IArrowCsv(File, InputStream):
+    """
+    Class to iterate over CSV files with pyarrow's streaming CSV reader.
+
+    Parsing and type conversion happen in Arrow, a block of `block_size` bytes at a time.
+    Column types are inferred from the first block, so `block_size` is also the inference sample,
+    unless an explicit `schema` is given. With `columnar=True` the stream yields one
+    `pyarrow.RecordBatch` per block instead of one dict per row. Sharding works as for `ICsv`.
+    """
+
+    _record_iter: Any = None
+    _columnar: bool = False
+    _block_size: int = 1 << 20
+    _delimiter: str = ','
+
+    def __init__(self, *args, columnar: bool = False, schema: Optional[pyarrow.Schema] = None,
+                 block_size: int = None, delimiter: str = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._columnar = columnar
+        self._schema = schema
+        if block_size is not None:
+            self._block_size = block_size
+        if delimiter is not None:
+            self._delimiter = delimiter
+
+    def open(self) -> Any:
+        log.info(f"Reading CSV file: `{self._path}`")
+        return self._fs.open(self._path, 'rb')
+
+    def init_stream(self):
+        if self._num_shards == 1:
+            reader = self._open_reader(self._file, self._schema)
+        else:
+            reader = self._open_shard()
+        self._schema = reader.schema
+        self._record_iter = iter_records(reader, self._columnar)
+
+    def __next__(self):
+        return next(self._record_iter)
+
+    def get_columns(self):
+        return {k: v for v, k in enumerate(self._schema.names)}
+
+    def get_types(self):
+        return {k: v for k, v in zip(self._schema.names, self._schema.types)}
+
+    def _open_reader(self, file: Any, schema: Optional[pyarrow.Schema], header: bool = True):
+        import pyarrow.csv as pacsv
+        read_options = pacsv.ReadOptions(
+            block_size=self._block_size,
+            column_names=None if header else schema.names,
+        )
+        parse_options = pacsv.ParseOptions(delimiter=self._delimiter)
+        convert_options = pacsv.ConvertOptions(column_types=schema) if schema is not None else None
+        return pacsv.open_csv(file, read_options=read_options, parse_options=parse_options,
+                              convert_options=convert_options)
+
+    def _open_shard(self):
+        # Every shard must agree on the column types, so they are taken from the start of the file
+        schema = self._schema
+        if schema is None:
+            self._file.seek(0)
+            schema = self._open_reader(self._file, None).schema
+        header_end = align_to_line(self._file, 1)
+        start, end = shard_range(header_end, self._fs.size(self._path), self._shard_index, self._num_shards)
+        start = max(align_to_line(self._file, start), header_end)
+        end = align_to_line(self._file, end)
+        if start >= end:
+            # Arrow rejects an empty CSV, e.g. when there are more shards than lines
+            return pyarrow.RecordBatchReader.from_batches(schema, [])
+        return self._open_reader(ByteRange(self._file, start, end), schema, header=False)
+
+
+FILE_STREAMS = {
+    FileFormat.PARQUET: IParquet,
+    FileFormat.CSV: ICsv,
+    FileFormat.JSON: IJson,
+    FileFormat.JSONL: IJsonLines,
+    FileFormat.ARROW: IArrow,
+}
+
+
+def infer_file_format(path: str) -> FileFormat:
+    """File format from the extension of `path`, ignoring a compression extension such as `.gz`."""
+    name = posixpath.basename(path)
+    if infer_compression(name) is not None:
+        name = posixpath.splitext(name)[0]
+    extension = posixpath.splitext(name)[1].lstrip('.').lower()
+    if extension == 'ndjson':
+        return FileFormat.JSONL
+    if extension in ('feather', 'ipc', 'arrows'):
+        return FileFormat.ARROW
+    try:
+        return FileFormat(extension)
+    except ValueError:
+        raise ValueError(f'Cannot infer the file format of `{path}`, pass `file_format`') from None
+
+
+def expand_paths(path: str, fs: Any) -> List[str]:
+    """
+    Sorted paths of the files matching a glob, or under a directory or S3 prefix, or `path` itself.
+    Files whose name starts with `.` or `_` (e.g. `_SUCCESS`) are left out of directories.
+    """
+    if any(c in path for c in '*?['):
+        paths = fs.glob(path)
+    elif fs.isdir(path):
+        paths = [p for p in fs.find(path) if not posixpath.basename(p).startswith(('.', '_'))]
+    else:
+        return [path]
+    # s3fs returns paths without the protocol, which picks the filesystem of every file stream
+    if path.startswith('s3://'):
+        paths = [f's3://{p}' for p in paths]
+    return sorted(paths)
+
+
+class IDataset(InputStream):
+    """
+    Class for reading every file matching a glob (`s3://bucket/events/*.parquet`), or under a
+    directory or S3 prefix, as one stream.
+
+    Files are opened and read in background threads, up to `max_open_files` at once, and their
+    records are interleaved on the queue as they arrive, so the latency of opening one file overlaps
+    with reading the others. Every file is read `prefetch_chunk` records at a time by the stream class
+    of its `file_format`, which is inferred from the extensions when not given, with `options` passed
+    on to it (e.g. `columns` for Parquet). Sharding assigns whole files to shards. Iterating
+    the stream directly reads the files one after another. Checkpoints are not supported.
+    """
+
+    _path: str
+    _fs: Any
+    _paths: List[str]
+    _file_format: Optional[FileFormat] = None
+    _max_open_files: int = 8
+    _options: Dict[str, Any]
+    _iter = None
+
+    def __init__(self, path: str, file_format: Optional[FileFormat] = None, max_open_files: int = None,
+                 options: Optional[Dict[str, Any]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self._path = path
+        self._fs = _choose_filesystem(path)
+        if file_format is not None:
+            self._file_format = FileFormat(file_format)
+        if max_open_files is not None:
+            if max_open_files < 1:
+                raise ValueError(f'max_open_files must be at least 1, got {max_open_files}')
+            self._max_open_files = max_open_files
+        self._options = options or {}
+        self._paths = []
+
+    def init_stream(self):
+        paths = expand_paths(self._path, self._fs)
+        if not paths:
+            raise ValueError(f'No files found at `{self._path}`')
+        start, end = shard_range(0, len(paths), self._shard_index, self._num_shards)
+        self._paths = paths[start:end]
+        log.info(f'Reading {len(self._paths)} of {len(paths)} files at `{self._path}`')
+        self._iter = itertools.chain.from_iterable(self._iter_file(p) for p in self._paths)
+
+    def __next__(self):
+        return next(self._iter)
+
+    def open_stream(self, path: str) -> InputStream:
+        """Open and initialise the stream reading a single file."""
+        file_format = self._file_format or infer_file_format(path)
+        stream = FILE_STREAMS[file_format](path, **self._options)
+        stream.init_stream()
+        return stream
+
+    def _iter_file(self, path: str) -> Iterator[Any]:
+        stream = self.open_stream(path)
+        try:
+            yield from stream
+        finally:
+            stream.close()
+
+    async def consume(self):
+        paths = collections.deque(self._paths)
+
+        async def read_files():
+            while paths:
+                await self._consume_file(paths.popleft())
+
+        readers = [asyncio.create_task(read_files()) for _ in range(min(self._max_open_files, len(paths)))]
+        try:
+            await asyncio.gather(*readers)
+        finally:
+            await cancel_all(readers)
+
+    async def _consume_file(self, path: str):
+        loop = asyncio.get_running_loop()
+        chunk_size = self._prefetch_chunk
+        # Shielded, so that on cancellation the thread still finishes before the file is closed
+        pending = loop.run_in_executor(None, self.open_stream, path)
+        stream = await asyncio.shield(pending)
+        try:
+            while True:
+                pending = loop.run_in_executor(None, lambda: list(itertools.islice(stream, chunk_size)))
+                chunk = await asyncio.shield(pending)
+                if not chunk:
+                    return
+                for message in chunk:
+                    await self._queue.put(self.create_task(message))
+                if self.metrics is not None:
+                    self.metrics.record_input(len(chunk))
+        finally:
+            if pending.done():
+                stream.close()
+            else:
+                pending.add_done_callback(lambda _: stream.close())
@@ -1,79 +1,305 @@
 import csv
+import decimal
 import io
 import json
-from typing import Any, Dict, List
+import logging
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+from urllib.parse import quote
 
 import pyarrow as pa
-import pyarrow.parquet as pq
+from fsspec.compression import compr
+from fsspec.utils import infer_compression
 
-from py_async.streams.core import File, OutputStream
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from py_async.streams.core import AppendableFile, File, FileFormat, OutputStream, _choose_filesystem
+
+if TYPE_CHECKING:
+    import pyarrow.parquet as pq
+
+log = logging.getLogger(__name__)
+
+
+class RecordBuffer:
+    """
+    Accumulates dict records column by column and seals them into `pyarrow.RecordBatch` objects.
+
+    Columns are fixed by `schema`, or by the keys of the first record when there is none; keys
+    that are not a column are dropped and missing keys become nulls. Records are sealed every
+    `batch_size` rows, after which their exact size is known through `nbytes`.
+    """
+
+    def __init__(self, schema: Optional[pa.Schema] = None, batch_size: int = 1024):
+        self.schema = schema
+        self._batch_size = batch_size
+        self._columns: Dict[str, List[Any]] = {}
+        self._record_index = 0
+        self.batches: List[pa.RecordBatch] = []
+        self.num_rows = 0
+        self.nbytes = 0
+
+    def append(self, record: Dict):
+        if not self._columns:
+            names = self.schema.names if self.schema is not None else record.keys()
+            self._columns = {k: [] for k in names}
+        for k, column in self._columns.items():
+            column.append(record.get(k))
+        self._record_index += 1
+        if self._record_index >= self._batch_size:
+            self.seal()
+
+    def append_batch(self, batch: pa.RecordBatch):
+        self.seal()
+        if self.schema is None:
+            self.schema = batch.schema
+        self.batches.append(batch)
+        self.num_rows += batch.num_rows
+        self.nbytes += batch.nbytes
+
+    def seal(self):
+        """Convert the buffered records into a RecordBatch, inferring the schema if it is not known yet."""
+        if self._record_index == 0:
+            return
+        batch = pa.RecordBatch.from_pydict(self._columns, schema=self.schema)
+        self._columns = {k: [] for k in self._columns}
+        self._record_index = 0
+        self.append_batch(batch)
+
+    def take_batches(self) -> List[pa.RecordBatch]:
+        """Remove and return the sealed batches."""
+        batches = self.batches
+        self.batches = []
+        self.num_rows = 0
+        self.nbytes = 0
+        return batches
+
+    def take(self, max_rows: Optional[int] = None) -> pa.Table:
+        """Remove and return up to `max_rows` sealed rows (all of them by default) as a Table."""
+        table = pa.Table.from_batches(self.take_batches(), schema=self.schema)
+        if max_rows is not None and table.num_rows > max_rows:
+            # The rest goes back ahead of the records that are not sealed yet, keeping them in order
+            self.batches = table.slice(max_rows).to_batches()
+            self.num_rows = table.num_rows - max_rows
+            self.nbytes = sum(batch.nbytes for batch in self.batches)
+            table = table.slice(0, max_rows)
+        return table
 
 
 class OParquet(File, OutputStream):
+    """
+    Class for writing streams to Parquet files.
+
+    Records may be dicts or `pyarrow.RecordBatch` objects. Dict records are accumulated into columns
+    and sealed into batches of `batch_size` rows. A row group is written once `row_group_size` rows
+    or `row_group_bytes` bytes are buffered, so memory use is bounded by one row group.
+    The schema is taken from the first batch unless one is given. `compression`,
+    `compression_level` and `use_dictionary` are passed on to `pyarrow.parquet.ParquetWriter`.
+    """
+
     _batch_size: int = 1024
-    _record_buffer: List[Any] = []
-    _record_index: int = 0
+    _row_group_size: int = 128 * 1024
+    _row_group_bytes: int = 128 << 20
+    _compression: str = 'snappy'
+    _compression_level: Optional[int] = None
+    _use_dictionary: bool | List[str] = True
+    _buffer: RecordBuffer
 
-    def __init__(self, *args, batch_size=None, **kwargs):
+    def __init__(self, *args, schema: Optional[pa.Schema] = None, batch_size: int = None,
+                 row_group_size: int = None, row_group_bytes: int = None, compression: str = None,
+                 compression_level: int = None, use_dictionary: bool | List[str] = None, **kwargs):
+        self._schema = schema
+        if batch_size is not None:
+            self._batch_size = batch_size
+        if row_group_size is not None:
+            self._row_group_size = row_group_size
+        if row_group_bytes is not None:
+            self._row_group_bytes = row_group_bytes
+        if compression is not None:
+            self._compression = compression
+        if compression_level is not None:
+            self._compression_level = compression_level
+        if use_dictionary is not None:
+            self._use_dictionary = use_dictionary
+        self._buffer = RecordBuffer(schema, self._batch_size)
         super().__init__(*args, **kwargs)
-        self._batch_size = batch_size | self._batch_size
 
-    def open(self) -> pq.ParquetWriter:
+    def open(self) -> Optional['pq.ParquetWriter']:
+        # Without a schema the writer can only be opened once the first batch is sealed
+        if self._schema is None:
+            return None
+        return self._open_writer(self._schema)
+
+    def _open_writer(self, schema: pa.Schema) -> 'pq.ParquetWriter':
+        import pyarrow.parquet as pq
+        self._schema = schema
         return pq.ParquetWriter(
-            self._path,
-            self._schema,
-            filesystem=self._fs
+            self.open_output(),
+            schema,
+            compression=self._compression,
+            compression_level=self._compression_level,
+            use_dictionary=self._use_dictionary,
         )
 
-    def write(self, record: Dict):
-        self._file.write(record)
+    def write(self, record: Dict | pa.RecordBatch):
+        if isinstance(record, pa.RecordBatch):
+            self._buffer.append_batch(record)
+        else:
+            self._buffer.append(record)
+        while self._buffer.num_rows >= self._row_group_size or self._buffer.nbytes >= self._row_group_bytes:
+            self._flush_buffer()
 
     def init_stream(self):
         return
 
     def close(self):
-        self._flush_buffer()
+        if not self._open:
+            return
+        self._buffer.seal()
+        while self._buffer.num_rows:
+            self._flush_buffer()
+        if self._file is None:
+            self._open = False
+            return
         super().close()
 
-    def __del__(self):
-        self.close()
-
     def _flush_buffer(self):
-        if self._record_index == 0:
+        """Write the buffered rows as a single row group of at most `row_group_size` rows."""
+        if self._buffer.num_rows == 0:
             return
-        self._file.write_batch(pa.RecordBatch.from_pylist(self._record_buffer, schema=self._schema))
-        self._record_buffer = []
-        self._record_index = 0
+        if self._file is None:
+            self._file = self._open_writer(self._buffer.schema)
+        table = self._buffer.take(self._row_group_size)
+        self._file.write_table(table, row_group_size=self._row_group_size)
+
 
+class OArrow(File, OutputStream):
+    """
+    Class for writing streams to Arrow IPC files, in the stream format or, with
+    `ipc_format='file'`, the file (Feather v2) format.
+
+    Records may be dicts or `pyarrow.RecordBatch` objects. Dict records are accumulated into batches
+    of `batch_size` rows like `OParquet`, and batches are written as they are, without encoding.
+    `compression` (`lz4` or `zstd`) compresses the buffers of every batch.
+    """
+
+    _batch_size: int = 1024
+    _ipc_format: str = 'stream'
+    _compression: Optional[str] = None
+    _writer: Any = None
+    _buffer: RecordBuffer
+
+    def __init__(self, *args, schema: Optional[pa.Schema] = None, batch_size: int = None, ipc_format: str = None,
+                 compression: Optional[str] = None, **kwargs):
+        self._schema = schema
+        if batch_size is not None:
+            self._batch_size = batch_size
+        if ipc_format is not None:
+            if ipc_format not in ('stream', 'file'):
+                raise ValueError(f"ipc_format must be 'stream' or 'file', got {ipc_format!r}")
+            self._ipc_format = ipc_format
+        self._compression = compression
+        self._buffer = RecordBuffer(schema, self._batch_size)
+        super().__init__(*args, **kwargs)
+
+    def open(self) -> Any:
+        return self.open_output()
+
+    def init_stream(self):
+        return
+
+    def _open_writer(self, schema: pa.Schema) -> Any:
+        import pyarrow.ipc as ipc
+        self._schema = schema
+        options = ipc.IpcWriteOptions(compression=self._compression)
+        if self._ipc_format == 'file':
+            return ipc.new_file(self._file, schema, options=options)
+        return ipc.new_stream(self._file, schema, options=options)
+
+    def write(self, record: Dict | pa.RecordBatch):
+        if isinstance(record, pa.RecordBatch):
+            self._buffer.append_batch(record)
+        else:
+            self._buffer.append(record)
+        if self._buffer.batches:
+            self._write_batches()
+
+    def _write_batches(self):
+        if self._writer is None:
+            self._writer = self._open_writer(self._buffer.schema)
+        for batch in self._buffer.take_batches():
+            self._writer.write_batch(batch)
+
+    def close(self):
+        if not self._open:
+            return
+        self._buffer.seal()
+        if self._buffer.batches or (self._writer is None and self._schema is not None):
+            self._write_batches()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        super().close()
+
+
+class OCsv(AppendableFile, OutputStream):
+    """
+    Class for writing streams to CSV files.
+
+    The header is taken from the schema, or from the keys of the first record when there is none.
+    A resumed file keeps the header it already has.
+    """
 
-class OCsv(File, OutputStream):
     _writer: csv.writer = None
+    _columns: Optional[List[str]] = None
 
     def open(self) -> io.TextIOWrapper:
-        return io.TextIOWrapper(self._fs.open(self._path, 'wb'), encoding='utf-8')
+        return io.TextIOWrapper(self.open_output(), encoding='utf-8')
 
     def init_stream(self):
+        self.open_file()
         self._writer = csv.writer(self._file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        self._writer.writerow(self._schema.names)
+        if self._resume_position is not None:
+            self._columns = self._read_header()
+        elif self._schema is not None:
+            self._write_header(self._schema.names)
         return
 
     def write(self, record: Dict):
-        self._writer.writerow([record[k] for k in self._schema.names])
+        if self._columns is None:
+            self._write_header(list(record.keys()))
+        self._writer.writerow([record[k] for k in self._columns])
 
-    def close(self):
-        return
+    def _write_header(self, columns: List[str]):
+        self._columns = columns
+        self._writer.writerow(columns)
+
+    def _read_header(self) -> Optional[List[str]]:
+        with self._fs.open(self._path, 'rb') as f:
+            header = next(csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline='')), None)
+        return header
 
 
-class OJson(File, OutputStream):
+class OJson(AppendableFile, OutputStream):
     _first_record: bool = True
-    _open: bool = False
+    _started: bool = False
 
     def open(self) -> io.TextIOWrapper:
-        return io.TextIOWrapper(self._fs.open(self._path, 'wb'), encoding='utf-8')
+        return io.TextIOWrapper(self.open_output(), encoding='utf-8')
 
     def init_stream(self):
+        self.open_file()
+        self._started = True
+        if self._resume_position is not None:
+            # Anything past the opening bracket is a record to continue after
+            self._first_record = self._resume_position <= len('[')
+            return
         self._first_record = True
-        self._open = True
         self._file.write('[')
         return
 
@@ -86,9 +312,261 @@ class OJson(File, OutputStream):
             self._file.write(',')
         self._file.write(json.dumps(record))
 
+    def close(self):
+        if self._open and self._started:
+            self._started = False
+            self._file.write(']')
+        super().close()
+
+
+def _json_default(obj: Any) -> Any:
+    # Types orjson does not serialize itself, as json.dumps(default=...) would need them too
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps_line(record: Any) -> bytes:
+    """Serialize a record as a single JSON line, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(record, default=_json_default, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(record, default=_json_default) + '\n').encode('utf-8')
+
+
+class OJsonLines(AppendableFile, OutputStream):
+    """
+    Class for writing streams to JSON Lines (NDJSON) files, one JSON value per line.
+
+    Records are serialized with orjson when it is installed, or the standard library otherwise,
+    and written in blocks of about `buffer_size` bytes. `compression` (e.g. `gzip`, or `zstd` with
+    zstandard installed) is by default inferred from the file name. Only uncompressed files can
+    be resumed from a checkpoint.
+    """
+
+    _buffer: List[bytes]
+    _buffered: int = 0
+    _buffer_size: int = 1 << 20
+    _compression: Optional[str] = 'infer'
+    _raw: Any = None
+
+    def __init__(self, *args, buffer_size: int = None, compression: Optional[str] = 'infer', **kwargs):
+        if buffer_size is not None:
+            self._buffer_size = buffer_size
+        self._compression = compression
+        self._buffer = []
+        super().__init__(*args, **kwargs)
+
+    def _infer_compression(self):
+        if self._compression == 'infer':
+            self._compression = infer_compression(self._path)
+
+    def open(self) -> Any:
+        self._infer_compression()
+        self._raw = self.open_output()
+        if self._compression is None:
+            return self._raw
+        return compr[self._compression](self._raw, mode='wb')
+
+    def init_stream(self):
+        self.open_file()
+        return
+
+    def check_resumable(self):
+        self._infer_compression()
+        if self._compression is not None:
+            raise ValueError(f'Cannot checkpoint `{self._path}`, compressed files cannot be appended to')
+        super().check_resumable()
+
+    def write(self, record: Any):
+        line = dumps_line(record)
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if self._buffered >= self._buffer_size:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        if self._buffer:
+            self._file.write(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def flush(self) -> int:
+        self._write_buffer()
+        return super().flush()
+
+    def close(self):
+        if self._open:
+            self._write_buffer()
+            if self._file is not self._raw:
+                # Closing the compressor writes its trailer but leaves the underlying file open
+                self._file.close()
+                self._file = self._raw
+        super().close()
+
+
+FILE_STREAMS = {
+    FileFormat.PARQUET: OParquet,
+    FileFormat.CSV: OCsv,
+    FileFormat.JSON: OJson,
+    FileFormat.JSONL: OJsonLines,
+    FileFormat.ARROW: OArrow,
+}
+
+HIVE_DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def partition_dir(names: List[str], values: Tuple) -> str:
+    """Hive-style `key=value/...` directory of a partition, `''` when there are no partition columns."""
+    return ''.join(
+        f'{name}={HIVE_DEFAULT_PARTITION if value is None else quote(str(value), safe="")}/'
+        for name, value in zip(names, values)
+    )
+
+
+@dataclass(slots=True)
+class PartFile:
+    path: str
+    partition: Dict[str, Any]
+    stream: OutputStream
+    rows: int = 0
+    bytes: int = 0
+
+
+class ODataset(OutputStream):
+    """
+    Class for writing a stream to a directory of part files instead of a single file.
+
+    A part file is closed and a new one started once it holds `max_rows_per_file` rows or
+    `max_bytes_per_file` bytes. Bytes are counted as they are written to the file, so a part can
+    exceed the limit by what its writer still buffers, up to a row group for Parquet. With `partition_by`,
+    records are written under Hive-style `column=value/` directories by the value of those columns,
+    which are left out of the records themselves. At most `max_open_files` part files are open at
+    once; when another one is needed, the least recently written one is closed, so it should be at
+    least the number of partitions written to at the same time. `options` are
+    passed on to the stream writing each part file, e.g. `compression` for Parquet.
+
+    Part files are named `part-<run>-<n>.<format>`, where `run` differs between runs, so several
+    shards can write to the same directory. On close, `_manifest-<run>.json` lists the part files of
+    the run with their partition values, number of rows and size in bytes.
+    """
+
+    _path: str
+    _fs: Any
+    _file_format: FileFormat = FileFormat.PARQUET
+    _partition_by: List[str]
+    _max_rows_per_file: Optional[int] = None
+    _max_bytes_per_file: Optional[int] = None
+    _max_open_files: int = 16
+    _options: Dict[str, Any]
+    _force: bool = False
+    _open: bool = False
+
+    def __init__(self, path: str, *args, file_format: FileFormat = None, partition_by: str | List[str] = None,
+                 max_rows_per_file: int = None, max_bytes_per_file: int = None, max_open_files: int = None,
+                 options: Optional[Dict[str, Any]] = None, force: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._path = path.rstrip('/')
+        self._fs = _choose_filesystem(path)
+        if file_format is not None:
+            self._file_format = FileFormat(file_format)
+        if isinstance(partition_by, str):
+            partition_by = [partition_by]
+        self._partition_by = list(partition_by or [])
+        self._max_rows_per_file = max_rows_per_file
+        self._max_bytes_per_file = max_bytes_per_file
+        if max_open_files is not None:
+            if max_open_files < 1:
+                raise ValueError(f'max_open_files must be at least 1, got {max_open_files}')
+            self._max_open_files = max_open_files
+        self._options = options or {}
+        self._force = force
+        self._run = uuid.uuid4().hex[:8]
+        self._parts = 0
+        # Open part files by partition, least recently written first
+        self._writers: OrderedDict[Tuple, PartFile] = OrderedDict()
+        self._manifest: List[PartFile] = []
+
+    def init_stream(self):
+        if self._force and self._fs.exists(self._path):
+            self._fs.rm(self._path, recursive=True)
+        self._open = True
+
+    def write(self, record: Dict | pa.RecordBatch):
+        if isinstance(record, pa.RecordBatch):
+            if self._partition_by:
+                raise ValueError('RecordBatch records cannot be partitioned, write dicts instead')
+            key, rows = (), record.num_rows
+        else:
+            key = tuple(record.get(name) for name in self._partition_by)
+            if key:
+                record = {k: v for k, v in record.items() if k not in self._partition_by}
+            rows = 1
+        part = self._writers.get(key)
+        if part is None:
+            part = self._open_part(key)
+        else:
+            self._writers.move_to_end(key)
+        part.stream.write(record)
+        part.rows += rows
+        part.bytes = part.stream.tell()
+        if (self._max_rows_per_file is not None and part.rows >= self._max_rows_per_file) or \
+                (self._max_bytes_per_file is not None and part.bytes >= self._max_bytes_per_file):
+            self._close_part(key)
+
+    def _open_part(self, key: Tuple) -> PartFile:
+        if len(self._writers) >= self._max_open_files:
+            self._close_part(next(iter(self._writers)))
+        directory = f'{self._path}/{partition_dir(self._partition_by, key)}'
+        self._fs.makedirs(directory, exist_ok=True)
+        path = f'{directory}part-{self._run}-{self._parts:05d}.{self._file_format}'
+        self._parts += 1
+        stream = FILE_STREAMS[self._file_format](path, **self._options)
+        stream.init_stream()
+        part = PartFile(path, dict(zip(self._partition_by, key)), stream)
+        self._writers[key] = part
+        self._manifest.append(part)
+        return part
+
+    def _close_part(self, key: Tuple):
+        part = self._writers.pop(key)
+        part.stream.close()
+        part.bytes = self._fs.size(part.path)
+        log.debug(f'Closed part file `{part.path}` after {part.rows} rows and {part.bytes} bytes')
+
+    async def drain(self):
+        for part in self._writers.values():
+            await part.stream.drain()
+
+    @property
+    def files(self) -> List[str]:
+        """Paths of the part files written so far."""
+        return [part.path for part in self._manifest]
+
     def close(self):
         if not self._open:
             return
         self._open = False
-        self._file.write(']')
-        return
+        while self._writers:
+            self._close_part(next(iter(self._writers)))
+        manifest = {
+            'format': str(self._file_format),
+            'partition_by': self._partition_by,
+            'rows': sum(part.rows for part in self._manifest),
+            'files': [
+                {'path': part.path[len(self._path) + 1:], 'partition': part.partition, 'rows': part.rows,
+                 'bytes': part.bytes}
+                for part in self._manifest
+            ],
+        }
+        self._fs.makedirs(self._path, exist_ok=True)
+        path = f'{self._path}/_manifest-{self._run}.json'
+        self._fs.pipe_file(path, json.dumps(manifest, default=str, indent=2).encode('utf-8'))
+        log.info(f'Wrote {len(self._manifest)} part files to `{self._path}`')
+
+    def abort(self):
+        # The part files still open are aborted, and without a manifest the run is recognisably incomplete
+        if not self._open:
+            return
+        self._open = False
+        while self._writers:
+            self._writers.popitem(last=False)[1].stream.abort()
@@ -0,0 +1,206 @@
+import asyncio
+import io
+import logging
+from abc import abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List
+
+
+log = logging.getLogger(__name__)
+
+# S3 rejects multipart parts smaller than 5 MiB, except for the last one
+MIN_PART_SIZE = 5 << 20
+
+
+class BackgroundWriter(io.RawIOBase):
+    """
+    Binary file object that buffers writes and hands them off to background threads in parts.
+
+    `write` never waits for I/O. At most `max_inflight_parts` parts should be pending, which
+    output streams enforce by awaiting `drain` after writing, so the event loop keeps running
+    while the upload catches up. `close` waits for all parts and commits the file, `abort` throws them
+    away. A writer that is garbage collected without being closed is aborted.
+    """
+
+    def __init__(self, fs: Any, path: str, part_size: int, max_inflight_parts: int):
+        super().__init__()
+        self._fs = fs
+        self._path = path
+        self._part_size = part_size
+        self._max_inflight_parts = max_inflight_parts
+        self._buffer = bytearray()
+        self._futures: List[Future] = []
+        self._position = 0
+        self._executor = ThreadPoolExecutor(max_workers=self._num_threads(), thread_name_prefix='upload')
+
+    def _num_threads(self) -> int:
+        return self._max_inflight_parts
+
+    @abstractmethod
+    def _submit(self, data: bytes):
+        """Start writing the next part in the background."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _commit(self, data: bytes):
+        """Write the remaining `data`, wait for all parts and finish the file."""
+        raise NotImplementedError
+
+    def _abort(self):
+        """Throw away the parts written so far, once no more are being written."""
+        pass
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def write(self, data: bytes) -> int:
+        if self.closed:
+            raise ValueError(f'Write to closed upload of `{self._path}`')
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self._part_size:
+            self._submit(bytes(self._buffer[:self._part_size]))
+            del self._buffer[:self._part_size]
+        return len(data)
+
+    def inflight(self) -> int:
+        """Number of parts that are still being written. Re-raises the error of a failed part."""
+        for f in self._futures:
+            if f.done() and f.exception() is not None:
+                raise f.exception()
+        self._futures = [f for f in self._futures if not f.done()]
+        return len(self._futures)
+
+    async def drain(self):
+        """Wait until fewer than `max_inflight_parts` parts are pending."""
+        while self.inflight() >= self._max_inflight_parts:
+            pending = [asyncio.wrap_future(f) for f in self._futures]
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._commit(bytes(self._buffer))
+            self._buffer = bytearray()
+        except Exception:
+            self._abort()
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+            super().close()
+
+    def abort(self, wait: bool = True):
+        """Stop writing without committing the file. With `wait`, parts being written finish first."""
+        if self.closed:
+            return
+        try:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._abort()
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+    def __del__(self):
+        # Only an explicit close commits the file. This may run in an upload thread, which cannot wait for itself
+        self.abort(wait=False)
+
+
+class ThreadedWriter(BackgroundWriter):
+    """
+    Writes parts in order from a single background thread through the fsspec file.
+    """
+
+    _file: Any = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._file = self._fs.open(self._path, 'wb')
+
+    def _num_threads(self) -> int:
+        return 1
+
+    def _submit(self, data: bytes):
+        self._futures.append(self._executor.submit(self._file.write, data))
+
+    def _commit(self, data: bytes):
+        if data:
+            self._submit(data)
+        for f in self._futures:
+            f.result()
+        self._executor.submit(self._file.close).result()
+
+    def _abort(self):
+        # Without multipart uploads to throw away, the file keeps the parts written so far
+        if self._file is not None:
+            self._file.close()
+
+
+class S3MultipartWriter(BackgroundWriter):
+    """
+    Uploads parts of an S3 multipart upload concurrently, completing the upload on close.
+
+    Files smaller than one part are written with a single PUT instead.
+    """
+
+    _upload_id: str = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self._part_size < MIN_PART_SIZE:
+            raise ValueError(f'part_size must be at least {MIN_PART_SIZE} bytes for S3, got {self._part_size}')
+        self._bucket, self._key, _ = self._fs.split_path(self._path)
+        self._parts: List[Future] = []
+
+    def _submit(self, data: bytes):
+        if self._upload_id is None:
+            response = self._fs.call_s3('create_multipart_upload', Bucket=self._bucket, Key=self._key)
+            self._upload_id = response['UploadId']
+            log.debug(f'Started multipart upload {self._upload_id} for `{self._path}`')
+        future = self._executor.submit(self._upload_part, len(self._parts) + 1, data)
+        self._parts.append(future)
+        self._futures.append(future)
+
+    def _upload_part(self, part_number: int, data: bytes) -> Dict[str, Any]:
+        response = self._fs.call_s3(
+            'upload_part',
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def _commit(self, data: bytes):
+        if self._upload_id is None:
+            self._fs.pipe_file(self._path, data)
+            return
+        if data:
+            self._submit(data)
+        parts = [f.result() for f in self._parts]
+        self._fs.call_s3(
+            'complete_multipart_upload',
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            MultipartUpload={'Parts': parts},
+        )
+        self._fs.invalidate_cache(self._path)
+        log.debug(f'Completed multipart upload {self._upload_id} of {len(parts)} parts for `{self._path}`')
+
+    def _abort(self):
+        if self._upload_id is None:
+            return
+        log.error(f'Aborting multipart upload {self._upload_id} for `{self._path}`')
+        self._fs.call_s3('abort_multipart_upload', Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+
+
+def open_background_writer(fs: Any, path: str, part_size: int, max_inflight_parts: int) -> BackgroundWriter:
+    # Compared by protocol, so that s3fs is only imported when S3 is used
+    if 's3' in fs.protocol:
+        return S3MultipartWriter(fs, path, part_size, max_inflight_parts)
+    return ThreadedWriter(fs, path, part_size, max_inflight_parts)
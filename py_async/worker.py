@@ -1,33 +1,64 @@
 import asyncio
+import itertools
 import logging
 import time
 import uuid
 from abc import abstractmethod, ABC
-from asyncio import FIRST_EXCEPTION
-from dataclasses import dataclass
-from typing import Any, Self
+from asyncio import FIRST_COMPLETED
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Self, Sequence, Tuple
 
+from py_async.autoscale import Autoscaler
+from py_async.cache import ResultCache, record_key
+from py_async.checkpoint import Checkpoint
+from py_async.metrics import MetricsCollector
 from py_async.streams.core import InputStream, OutputStream, TaskStatus, \
-    TaskDefinition, cancel_all
+    TaskDefinition, ByteBudgetQueue, cancel_all, create_queue, estimate_size
 
 log = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class TaskResult:
     data: Any
     status: TaskStatus = TaskStatus.INPROGRESS
 
 
-@dataclass
+@dataclass(slots=True)
 class WorkerContext:
     context: Any
-    worker_id: uuid.UUID = uuid.uuid4()
+    worker_id: uuid.UUID = field(default_factory=uuid.uuid4)
+
+
+def _compute_batch(compute: Callable[[Any], TaskResult], data: List[Any]) -> List[TaskResult]:
+    return [compute(d) for d in data]
 
 
 class Worker(ABC):
-    _input_stream: InputStream
-    _output_stream: OutputStream
+    """
+    Base class for workers that take records off one or more input streams, `process` them and
+    hand the results to one or more output streams.
+
+    Several input streams share a single bounded queue. Streams waiting for room on it are served
+    in turn, so they are merged fairly into the worker pool. Results go to every output stream,
+    or to the one picked by the `route` function given to `output`.
+    """
+
+    _input_streams: List[InputStream]
+    _input_queue: asyncio.Queue
+    _output_streams: List[OutputStream]
+    _route: Optional[Callable[[TaskDefinition], OutputStream | Sequence[OutputStream]]] = None
+    _executor: Optional[Executor] = None
+    _cache: Optional[ResultCache] = None
+    _cache_columns: Optional[Sequence[str]] = None
+    _inflight: Dict[str, asyncio.Future]
+    _checkpoint: Optional[Checkpoint] = None
+    _autoscaler: Optional[Autoscaler] = None
+    _tasks: List[asyncio.Task]
+    _retiring: int = 0
+    _ordered_streams: List[OutputStream] = []
+    metrics: Optional[MetricsCollector] = None
 
     @abstractmethod
     async def process(self, data: Any, context: WorkerContext) -> TaskResult:
@@ -37,89 +68,519 @@ class Worker(ABC):
     def worker_init(self) -> WorkerContext:
         pass
 
-    def input(self, stream: InputStream) -> Self:
-        self._input_stream = stream
+    def input(self, *streams: InputStream) -> Self:
+        if not streams:
+            raise ValueError('At least one input stream is required')
+        self._input_streams = list(streams)
+        if len(streams) == 1:
+            self._input_queue = streams[0].queue
+            return self
+        budgets = [s.queue.max_bytes for s in streams if isinstance(s.queue, ByteBudgetQueue)]
+        self._input_queue = create_queue(max(s.queue.maxsize for s in streams), max(budgets, default=None))
+        for stream in streams:
+            stream._queue = self._input_queue
+        return self
+
+    def output(self, *streams: OutputStream,
+               route: Optional[Callable[[TaskDefinition], OutputStream | Sequence[OutputStream]]] = None) -> Self:
+        """
+        Write results to `streams`. With `route`, every finished task is written only to the stream (or
+        streams) returned by `route(task)`, e.g. by `task.status` or a key in `task.data`, otherwise to all of them.
+        """
+        if not streams:
+            raise ValueError('At least one output stream is required')
+        self._output_streams = list(streams)
+        self._route = route
+        return self
+
+    def cache(self, cache: ResultCache, columns: Optional[Sequence[str]] = None) -> Self:
+        """
+        Put a result cache in front of `process`, keyed on the record or only on its `columns`.
+
+        Only COMPLETED results are cached. Identical records processed concurrently are coalesced
+        into a single `process` call.
+        """
+        self._cache = cache
+        self._cache_columns = columns
+        self._inflight = {}
+        return self
+
+    def checkpoint(self, path: str, interval: float = 60.0, resume: bool = True) -> Self:
+        """
+        Save a checkpoint to `path` every `interval` seconds, and resume from it if it exists.
+
+        The input stream must track record positions and the output stream must support resuming,
+        see `InputStream.seek` and `OutputStream.resume`. The checkpoint is removed after a successful run.
+        """
+        self._checkpoint = Checkpoint(path, interval, resume)
         return self
 
-    def output(self, stream: OutputStream) -> Self:
-        self._output_stream = stream
+    def autoscale(self, autoscaler: Autoscaler) -> Self:
+        """Let `autoscaler` change the number of workers while running, starting from `num_workers`."""
+        self._autoscaler = autoscaler
         return self
 
+    @property
+    def queue(self) -> asyncio.Queue:
+        """The asyncio.Queue that the workers take tasks from."""
+        return self._input_queue
+
+    @property
+    def num_workers(self) -> int:
+        """Number of running consumer tasks, not counting those about to retire."""
+        return sum(not t.done() for t in self._tasks) - self._retiring
+
+    def scale(self, num_workers: int):
+        """
+        Start or retire consumer tasks until `num_workers` are running. Retiring tasks finish the
+        task (or batch) they are working on, or take off the queue next, first.
+        """
+        self._tasks = [t for t in self._tasks if not t.done()]
+        running = self.num_workers
+        if num_workers < running:
+            self._retiring += running - num_workers
+            return
+        revoked = min(self._retiring, num_workers - running)
+        self._retiring -= revoked
+        for _ in range(num_workers - running - revoked):
+            self._tasks.append(asyncio.create_task(self.consume()))
+
+    def retire(self) -> bool:
+        """Called by a consumer between tasks, returns whether it should stop."""
+        if self._retiring <= 0:
+            return False
+        self._retiring -= 1
+        return True
+
+    async def drop_task(self, task: TaskDefinition):
+        """Account for a task that will never reach the output streams."""
+        if self._checkpoint is not None:
+            self._checkpoint.complete(task.offset)
+        for stream in self._ordered_streams:
+            await stream.queue.put(self._placeholder(task))
+
+    @staticmethod
+    def _placeholder(task: TaskDefinition) -> TaskDefinition:
+        return TaskDefinition(task.input_stream_id, None, TaskStatus.DROPPED, task.id, task.offset)
+
+    async def admit(self, task: TaskDefinition):
+        """Wait until `task` is within the reorder window of every ordered output stream."""
+        for stream in self._ordered_streams:
+            await stream.admit(task.id)
+
+    async def cached_process(self, data: Any, context: WorkerContext) -> TaskResult:
+        if self._cache is None:
+            return await self.process(data, context)
+        key = record_key(data, self._cache_columns)
+        result = self._cache.get(key)
+        if result is not None:
+            return result
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._cache.coalesced += 1
+            return await asyncio.shield(inflight)
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self.process(data, context)
+            if result.status == TaskStatus.COMPLETED:
+                self._cache.set(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(RuntimeError(f'Coalesced request failed: {e!r}'))
+            # Nobody may be waiting for the coalesced result
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def run_in_executor(self, func: Callable, *args) -> Any:
+        """Run a blocking function in the executor given to `run` (or the loop's default executor)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def put_result(self, task: TaskDefinition, result: TaskResult):
+        """Hand the result of a task over to the output streams it is routed to."""
+        task.data = result.data
+        task.status = result.status
+        streams = self._route(task) if self._route is not None else self._output_streams
+        if isinstance(streams, OutputStream):
+            streams = (streams,)
+        for stream in streams:
+            await stream.queue.put(task)
+        if self._route is not None:
+            # Ordered streams need to see every task, or they wait for it forever
+            for stream in self._ordered_streams:
+                if stream not in streams:
+                    await stream.queue.put(self._placeholder(task))
+
     async def consume(self):
         worker_context = self.worker_init()
         worker_id = uuid.uuid4()
-        log.debug(f'Worker {worker_id} started.')
-        count = 0
-        task_id = None
-        while True:
+        metrics = self.metrics
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug(f'Worker {worker_id} started.')
+        while not self.retire():
+            task = None
+            task_id = None
             try:
-                count += 1
-                task_id = None
-                _time = time.time()
-                task: TaskDefinition = await self._input_stream.queue.get()
+                _time = time.perf_counter()
+                task: TaskDefinition = await self._input_queue.get()
                 task_id = task.id
-                log.debug(f'Worker {worker_id} processing task {task.id}. Waited {time.time() - _time}.')
-                _time = time.time()
-                result: TaskResult = await self.process(task.data, worker_context)
-                log.debug(f'Worker {worker_id} processed task {task.id} with {result.status} in {time.time() - _time}.')
-                await self._output_stream.queue.put(result.data)
-                log.debug(f'Worker {worker_id} put task {task.id}.')
+                if self._ordered_streams:
+                    await self.admit(task)
+                _waited = time.perf_counter()
+                metrics.record_wait(_waited - _time)
+                if debug:
+                    log.debug(f'Worker {worker_id} processing task {task.id}. Waited {_waited - _time}.')
+                result: TaskResult = await self.cached_process(task.data, worker_context)
+                _time = time.perf_counter()
+                metrics.record_process(_time - _waited)
+                metrics.record_status(result.status)
+                if debug:
+                    log.debug(f'Worker {worker_id} processed task {task.id} with {result.status} in {_time - _waited}.')
+                await self.put_result(task, result)
+                metrics.record_put(time.perf_counter() - _time)
+                if debug:
+                    log.debug(f'Worker {worker_id} put task {task.id}.')
             except asyncio.CancelledError:
                 log.info(f'Worker {worker_id} cancelled')
                 raise
             except Exception as e:
+                metrics.record_status('ERROR')
                 log.error(f'Worker {worker_id} finished {task_id} with unexpected exception: {e}.')
+                if task is not None:
+                    await self.drop_task(task)
             finally:
-                # Call task_done on the task
-                self._input_stream.queue.task_done()
-                log.debug(f'Worker {worker_id} finished {task_id} successfully.')
-
-    async def run(self, num_workers: int = 1):
-        input_tasks = [asyncio.create_task(self._input_stream.consume())]
-        worker_tasks = []
-        for i in range(num_workers):
-            worker_tasks.append(asyncio.create_task(self.consume()))
-        output_tasks = [asyncio.create_task(self._output_stream.consume())]
-        pending = [*input_tasks, *worker_tasks, *output_tasks]
-        input_tasks_done = 0
-        success = True
-        while pending:
+                # Call task_done on the task, but only if one was taken off the queue
+                if task is not None:
+                    self._input_queue.task_done()
+                    if debug:
+                        log.debug(f'Worker {worker_id} finished {task_id}.')
+
+    async def start(self):
+        """Acquire resources shared by all workers, before any of them starts."""
+        return
+
+    async def stop(self):
+        """Release the resources acquired by `start`, after every worker has finished."""
+        return
+
+    def prepare(self, executor: Optional[Executor] = None, metrics: Optional[MetricsCollector] = None):
+        """Attach the executor and metrics collector of a run, as done by `run` or a `Pipeline`."""
+        self._executor = executor
+        self._tasks = []
+        self._retiring = 0
+        self.metrics = metrics if metrics is not None else MetricsCollector()
+        self.metrics.start()
+        self.metrics.watch_queue('input', self._input_queue)
+        for i, stream in enumerate(self._output_streams):
+            self.metrics.watch_queue('output' if len(self._output_streams) == 1 else f'output_{i}', stream.queue)
+        for stream in [*self._input_streams, *self._output_streams]:
+            stream.metrics = self.metrics
+        self._ordered_streams = [stream for stream in self._output_streams if stream.ordered]
+        if self._ordered_streams and len(self._input_streams) > 1:
+            raise ValueError('Ordered output requires a single input stream')
+
+    def finish(self):
+        self.metrics.report()
+        if self._cache is not None:
+            log.info(f'Result cache: {self._cache.stats()}')
+
+    async def run(self, num_workers: int = 1, executor: Optional[Executor] = None,
+                  metrics: Optional[MetricsCollector] = None):
+        self.prepare(executor, metrics)
+        if self._checkpoint is not None:
+            self._resume()
+        await self.start()
+        try:
+            await self._run(num_workers)
+        finally:
+            await self.stop()
+            self.finish()
+
+    def _resume(self):
+        if len(self._input_streams) > 1 or len(self._output_streams) > 1:
+            raise ValueError('Checkpoints require a single input and a single output stream')
+        input_stream, output_stream = self._input_streams[0], self._output_streams[0]
+        # Fail before any record is processed, not at the first save
+        output_stream.check_resumable()
+        input_stream.checkpoint = self._checkpoint
+        output_stream.checkpoint = self._checkpoint
+        state = self._checkpoint.load()
+        if state is None:
+            input_stream.track_positions()
+            return
+        input_stream.seek(state['watermark'], state['done'])
+        output_stream.resume(state['output_position'])
+
+    async def _run(self, num_workers: int):
+        success = await run_stages(self._input_streams, [(self, num_workers)], self._output_streams,
+                                   [self.metrics.report_periodically()])
+        if self._checkpoint is not None and success:
+            self._checkpoint.remove()
+
+
+async def run_stages(input_streams: Sequence[InputStream], stages: Sequence[Tuple[Worker, int]],
+                     output_streams: Sequence[OutputStream], background: Sequence[Coroutine] = ()) -> bool:
+    """
+    Run the input streams, `num_workers` consumers of every `(worker, num_workers)` stage and the output
+    streams until all input has been read and every task has been handed to the output streams.
+
+    Once the inputs are exhausted the stages are drained in order: when the input queue of a stage is
+    empty its workers are cancelled, so no worker is cancelled while a previous stage can still
+    give it work. Returns whether the run succeeded. If any task fails with an unexpected
+    exception everything is cancelled, the checkpoints of the output streams are saved and the
+    output streams are aborted.
+    """
+    for stream in [*input_streams, *output_streams]:
+        stream.init_stream()
+    input_tasks = [asyncio.create_task(stream.consume()) for stream in input_streams]
+    autoscaler_tasks = {}
+    for worker, num_workers in stages:
+        worker.scale(num_workers)
+        if worker._autoscaler is not None:
+            autoscaler_tasks[worker] = asyncio.create_task(worker._autoscaler.run(worker))
+    output_tasks = [asyncio.create_task(stream.consume()) for stream in output_streams]
+    background_tasks = [*autoscaler_tasks.values(), *(asyncio.create_task(coroutine) for coroutine in background)]
+    pending = [*input_tasks, *itertools.chain.from_iterable(worker._tasks for worker, _ in stages), *output_tasks]
+    input_tasks_done = 0
+    success = True
+    while pending:
+        try:
+            done, pending = await asyncio.wait(pending, timeout=2, return_when=FIRST_COMPLETED)
+            for t in done:
+                r = t.result()
+                log.info(f'Task {t.get_name()} finished with {r}')
+                if t in input_tasks:
+                    input_tasks_done += 1
+            if input_tasks_done == len(input_tasks):
+                break
+        except Exception as e:
+            log.error(f"Unexpected exception: {e}")
+            success = False
+            break
+
+    if not success:
+        # If any input, worker, or output task fails with an unexpected exception
+        #  we must cancel all tasks to prevent hanging of the entire process.
+        # Including workers started by an autoscaler
+        await cancel_all([*pending, *background_tasks, *(t for worker, _ in stages for t in worker._tasks)])
+        for stream in output_streams:
+            if stream.checkpoint is not None:
+                try:
+                    stream.save_checkpoint()
+                except Exception as e:
+                    log.error(f'Could not save checkpoint: {e}')
             try:
-                done, pending = await asyncio.wait(pending, timeout=2, return_when=FIRST_EXCEPTION)
-                for t in done:
-                    r = t.result()
-                    log.info(f'Task {t.get_name()} finished with {r}')
-                    if t in input_tasks:
-                        input_tasks_done += 1
-                if input_tasks_done == len(input_tasks):
-                    break
+                stream.abort()
             except Exception as e:
-                log.error(f"Unexpected exception: {e}")
-                success = False
+                log.error(f'Could not abort output stream: {e}')
+        log.error('Finished with Error.')
+        return False
+
+    # All input tasks are done.
+    # Wait until each stage's queue is empty, then cancel its workers, which are idle
+    for worker, _ in stages:
+        await worker._input_queue.join()
+        log.info("Gathered input queue task")
+        # Stopped first, so that it does not start workers that nothing would cancel
+        if worker in autoscaler_tasks:
+            await cancel_all([autoscaler_tasks[worker]])
+        await cancel_all(worker._tasks)
+        log.info('Gathered worker tasks')
+    for stream in output_streams:
+        await stream.queue.join()
+    log.info("Gathered output queue task")
+
+    # Result queue is completely empty, workers are not adding anymore tasks
+    # We can safely cancel the output task
+    await cancel_all([*output_tasks, *background_tasks])
+    log.info('Gathered output tasks')
+    for stream in output_streams:
+        stream.close()
+
+    log.info('Finished with Success.')
+    return True
+
+
+class BatchWorker(Worker):
+    """
+    Worker that hands micro-batches of tasks to the user code.
+
+    Up to `batch_size` tasks are taken off the input queue, waiting at most `batch_timeout`
+    seconds after the first one arrived, and `process_batch` is called once for all of them.
+    With `batch_bytes`, a batch is also closed once its records take up that many bytes as
+    measured by `size_estimator`. Results are put on the output queue in the order of the batch.
+    """
+
+    _batch_size: int = 64
+    _batch_timeout: float = 0.05
+    _batch_bytes: Optional[int] = None
+    _size_estimator: Callable[[Any], int] = staticmethod(estimate_size)
+
+    def __init__(self, batch_size: int = None, batch_timeout: float = None, batch_bytes: int = None,
+                 size_estimator: Callable[[Any], int] = None):
+        if batch_size is not None:
+            if batch_size < 1:
+                raise ValueError(f'batch_size must be positive, got {batch_size}')
+            self._batch_size = batch_size
+        if batch_timeout is not None:
+            self._batch_timeout = batch_timeout
+        if batch_bytes is not None:
+            self._batch_bytes = batch_bytes
+        if size_estimator is not None:
+            self._size_estimator = size_estimator
+
+    @abstractmethod
+    async def process_batch(self, data: List[Any], context: WorkerContext) -> List[TaskResult]:
+        """Process a batch of records, returning exactly one result per record in the same order."""
+        pass
+
+    async def process(self, data: Any, context: WorkerContext) -> TaskResult:
+        results = await self.process_batch([data], context)
+        return results[0]
+
+    async def cached_process_batch(self, data: List[Any], context: WorkerContext) -> List[TaskResult]:
+        """Call `process_batch` only for the records missing from the cache and not already in flight."""
+        if self._cache is None:
+            return await self.process_batch(data, context)
+        loop = asyncio.get_running_loop()
+        results: List[Any] = [None] * len(data)
+        waiting = {}
+        misses = {}
+        for i, d in enumerate(data):
+            key = record_key(d, self._cache_columns)
+            result = self._cache.get(key)
+            if result is not None:
+                results[i] = result
+            elif key in self._inflight:
+                # In flight in another worker, or a duplicate within this batch
+                self._cache.coalesced += 1
+                waiting[i] = self._inflight[key]
+            else:
+                misses[key] = i
+                self._inflight[key] = loop.create_future()
+        try:
+            if misses:
+                computed = await self.process_batch([data[i] for i in misses.values()], context)
+                if len(computed) != len(misses):
+                    raise ValueError(f'process_batch returned {len(computed)} results for {len(misses)} tasks')
+                for (key, i), result in zip(misses.items(), computed):
+                    results[i] = result
+                    if result.status == TaskStatus.COMPLETED:
+                        self._cache.set(key, result)
+                    self._inflight[key].set_result(result)
+        except BaseException as e:
+            for key in misses:
+                if not self._inflight[key].done():
+                    self._inflight[key].set_exception(RuntimeError(f'Coalesced request failed: {e!r}'))
+                    self._inflight[key].exception()
+            raise
+        finally:
+            for key in misses:
+                del self._inflight[key]
+        for i, future in waiting.items():
+            results[i] = await asyncio.shield(future)
+        return results
+
+    async def get_batch(self) -> List[TaskDefinition]:
+        queue = self._input_queue
+        batch = [await queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._batch_timeout
+        nbytes = self._size_estimator(batch[0]) if self._batch_bytes is not None else 0
+        while len(batch) < self._batch_size:
+            if self._batch_bytes is not None and nbytes >= self._batch_bytes:
                 break
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            if self._batch_bytes is not None:
+                nbytes += self._size_estimator(batch[-1])
+        return batch
 
-        if not success:
-            # If any input, worker, or output task fails with an unexpected exception
-            #  we must cancel all tasks to prevent hanging of the entire process.
-            await cancel_all(pending)
-            log.error('Finished with Error.')
-            return
+    async def consume(self):
+        worker_context = self.worker_init()
+        worker_id = uuid.uuid4()
+        metrics = self.metrics
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug(f'Batch worker {worker_id} started.')
+        while not self.retire():
+            batch = []
+            try:
+                _time = time.perf_counter()
+                batch = await self.get_batch()
+                if self._ordered_streams:
+                    # The batch may hold the head of the window, so only its first task is admitted
+                    await self.admit(batch[0])
+                _waited = time.perf_counter()
+                metrics.record_wait(_waited - _time)
+                if debug:
+                    log.debug(f'Batch worker {worker_id} processing {len(batch)} tasks. Waited {_waited - _time}.')
+                results = await self.cached_process_batch([task.data for task in batch], worker_context)
+                if len(results) != len(batch):
+                    raise ValueError(f'process_batch returned {len(results)} results for {len(batch)} tasks')
+                _time = time.perf_counter()
+                metrics.record_process(_time - _waited, len(batch))
+                if debug:
+                    log.debug(f'Batch worker {worker_id} processed {len(batch)} tasks in {_time - _waited}.')
+                for task, result in zip(batch, results):
+                    metrics.record_status(result.status)
+                    await self.put_result(task, result)
+                metrics.record_put(time.perf_counter() - _time)
+            except asyncio.CancelledError:
+                log.info(f'Batch worker {worker_id} cancelled')
+                raise
+            except Exception as e:
+                metrics.record_status('ERROR')
+                log.error(f'Batch worker {worker_id} failed a batch of {len(batch)} tasks with unexpected exception: {e}.')
+                for task in batch:
+                    await self.drop_task(task)
+            finally:
+                for _ in batch:
+                    self._input_queue.task_done()
 
-        # All input tasks are done.
-        # Wait until the queues are empty.
-        await self._input_stream.queue.join()
-        log.info("Gathered input queue task")
-        await self._output_stream.queue.join()
-        log.info("Gathered output queue task")
 
-        # Given success, worker tasks must be cancelled but only once queues are empty.
-        await cancel_all(worker_tasks)
-        log.info('Gathered worker tasks')
+class ExecutorWorker(BatchWorker):
+    """
+    Worker for CPU-bound work that runs `compute` in a `concurrent.futures` executor.
 
-        # Result queue is completely empty, workers are not adding anymore tasks
-        # We can safely cancel the output task
-        await cancel_all({output_tasks})
-        log.info('Gathered output tasks')
+    Each batch is sent to the executor in a single call, so inter-process overhead is paid once per
+    batch rather than once per record. With a `ProcessPoolExecutor`, `compute` must be picklable,
+    i.e. a staticmethod of a module level class. If `run` is not given an executor, a
+    `ProcessPoolExecutor` is created by `start` and shut down by `stop`. Use at least as many
+    workers as the executor has processes to keep all of them busy.
+    """
 
-        log.info('Finished with Success.')
-        return
+    _batch_size: int = 256
+    _own_executor: Optional[Executor] = None
+
+    @staticmethod
+    @abstractmethod
+    def compute(data: Any) -> TaskResult:
+        pass
+
+    def worker_init(self) -> WorkerContext:
+        return WorkerContext(None)
+
+    async def process_batch(self, data: List[Any], context: WorkerContext) -> List[TaskResult]:
+        return await self.run_in_executor(_compute_batch, self.compute, data)
+
+    async def start(self):
+        if self._executor is None:
+            self._own_executor = self._executor = ProcessPoolExecutor()
+
+    async def stop(self):
+        if self._own_executor is not None:
+            self._own_executor.shutdown()
+            self._own_executor = self._executor = None
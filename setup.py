@@ -84,6 +84,8 @@ setup(
         "aiohttp",
     ],  # Optional
     extras_require={
+        "fast": ["orjson"],
+        "zstd": ["zstandard"],
         "dev": [
             "pytest",
             "pytest-cov",
@@ -93,11 +95,12 @@ setup(
             "flake8",
             "black",
             "memory-profiler",
+            "moto[server]",
         ],
     },
     entry_points={
         'console_scripts': [
-            'loopback = py_async.cmd:loopback',
+            'loopback = py_async.cmd:loopback_cmd',
         ],
     },
 )
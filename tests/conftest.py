@@ -0,0 +1,72 @@
+import asyncio
+import os
+import socket
+import uuid
+from typing import Any
+
+import pytest
+
+from py_async.streams.core import TaskStatus
+from py_async.worker import Worker, WorkerContext, TaskResult
+
+BUCKET = 'py-async-test'
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope='session')
+def s3_server():
+    """A moto S3 server with an empty bucket, which s3fs and boto3 reach through `AWS_ENDPOINT_URL`."""
+    moto_server = pytest.importorskip('moto.server')
+    port = free_port()
+    server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    environ = {
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ENDPOINT_URL': f'http://127.0.0.1:{port}',
+    }
+    saved = {k: os.environ.get(k) for k in environ}
+    os.environ.update(environ)
+    import boto3
+    client = boto3.client('s3')
+    client.create_bucket(Bucket=BUCKET)
+    yield client
+    server.stop()
+    for k, v in saved.items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+
+
+@pytest.fixture
+def s3_path(s3_server) -> str:
+    """A prefix of the test bucket that no other test uses."""
+    return f's3://{BUCKET}/{uuid.uuid4().hex}'
+
+
+class EchoWorker(Worker):
+    """
+    Worker returning every record unchanged after `delay(record)` seconds. Records for which
+    `fail(record)` is true are FAILED.
+    """
+
+    def __init__(self, delay=None, fail=None):
+        self._delay = delay
+        self._fail = fail
+
+    def worker_init(self) -> WorkerContext:
+        return WorkerContext(None)
+
+    async def process(self, data: Any, context: WorkerContext) -> TaskResult:
+        if self._delay is not None:
+            await asyncio.sleep(self._delay(data))
+        if self._fail is not None and self._fail(data):
+            return TaskResult(data, TaskStatus.FAILED)
+        return TaskResult(data, TaskStatus.COMPLETED)
@@ -0,0 +1,38 @@
+import asyncio
+import json
+
+from py_async.autoscale import Autoscaler
+from py_async.streams.input import IJsonLines
+from py_async.streams.output import OJsonLines
+
+from conftest import EchoWorker
+
+ROWS = 300
+
+
+class SlowOutput(OJsonLines):
+    async def _write_task(self, td):
+        await asyncio.sleep(0.002)
+        await super()._write_task(td)
+
+
+def test_no_workers_left_after_run(tmp_path):
+    source, target = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    source.write_text(''.join(json.dumps({'a': i}) + '\n' for i in range(ROWS)))
+
+    async def run():
+        # Any latency is over the target, so every tick scales to min_workers, even once the workers are cancelled
+        autoscaler = Autoscaler(1, 8, interval=0.02, target_latency=1e-9, min_samples=1)
+        worker = (EchoWorker(delay=lambda data: 0.001)
+                  .input(IJsonLines(str(source)))
+                  .output(SlowOutput(str(target)))
+                  .autoscale(autoscaler))
+        await worker.run(4)
+        # Let any consumer started after the workers were cancelled get going
+        await asyncio.sleep(0.1)
+        current = asyncio.current_task()
+        return [t for t in asyncio.all_tasks() if t is not current and not t.done()]
+
+    assert asyncio.run(run()) == []
+    with open(target) as f:
+        assert sorted(json.loads(line)['a'] for line in f) == list(range(ROWS))
@@ -0,0 +1,77 @@
+import asyncio
+import datetime
+
+import pyarrow as pa
+import pytest
+
+from py_async.cache import MemoryCache, record_key
+from py_async.streams.core import TaskStatus
+from py_async.worker import BatchWorker, TaskResult, WorkerContext
+
+
+class CountingBatchWorker(BatchWorker):
+    def __init__(self, drop_last: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = []
+        self._drop_last = drop_last
+
+    def worker_init(self) -> WorkerContext:
+        return WorkerContext(None)
+
+    async def process_batch(self, data, context):
+        self.calls.append(data)
+        await asyncio.sleep(0.01)
+        results = [TaskResult(d, TaskStatus.COMPLETED) for d in data]
+        return results[:-1] if self._drop_last else results
+
+
+def test_batch_cache_and_coalescing():
+    async def run():
+        worker = CountingBatchWorker().cache(MemoryCache())
+        first = asyncio.create_task(worker.cached_process_batch([{'a': 1}, {'a': 2}], None))
+        await asyncio.sleep(0)
+        # {'a': 2} is in flight, and {'a': 3} is a duplicate within the batch
+        second = await worker.cached_process_batch([{'a': 2}, {'a': 3}, {'a': 3}], None)
+        await first
+        third = await worker.cached_process_batch([{'a': 1}, {'a': 3}], None)
+        return worker, second, third
+
+    worker, second, third = asyncio.run(run())
+    assert worker.calls == [[{'a': 1}, {'a': 2}], [{'a': 3}]]
+    assert [r.data for r in second] == [{'a': 2}, {'a': 3}, {'a': 3}]
+    assert [r.data for r in third] == [{'a': 1}, {'a': 3}]
+    assert worker._cache.stats() == {'hits': 2, 'misses': 5, 'coalesced': 2}
+
+
+def test_wrong_number_of_results_fails_coalesced_requests():
+    async def run():
+        worker = CountingBatchWorker(drop_last=True).cache(MemoryCache())
+        first = asyncio.create_task(worker.cached_process_batch([{'a': 1}, {'a': 2}], None))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(worker.cached_process_batch([{'a': 2}], None))
+        return await asyncio.wait_for(asyncio.gather(first, second, return_exceptions=True), 1)
+
+    first, second = asyncio.run(run())
+    assert isinstance(first, ValueError) and 'returned 1 results for 2 tasks' in str(first)
+    # The worker waiting on {'a': 2} fails too, instead of waiting forever
+    assert isinstance(second, RuntimeError)
+
+
+def test_record_key():
+    assert record_key({'a': 1, 'b': [1, 2]}) == record_key({'b': [1, 2], 'a': 1})
+    assert record_key({'a': 1, 'b': 2}, columns=['a']) == record_key({'a': 1, 'b': 3}, columns=['a'])
+    assert record_key({'a': datetime.date(2024, 1, 1)}) != record_key({'a': '2024-01-01'})
+    with pytest.raises(TypeError):
+        record_key({'a': object()})
+
+
+def test_record_key_of_record_batches():
+    values = list(range(100))
+    batch = pa.record_batch({'x': values, 'y': values})
+    values[50] = 999
+    # Differs only in the middle, which the string form of a batch leaves out
+    other = pa.record_batch({'x': values, 'y': list(range(100))})
+    assert str(batch) == str(other)
+    assert record_key(batch) != record_key(other)
+    assert record_key(batch) == record_key(pa.record_batch({'x': range(100), 'y': range(100)}))
+    assert record_key(batch, columns=['y']) == record_key(other, columns=['y'])
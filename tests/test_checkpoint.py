@@ -0,0 +1,159 @@
+import asyncio
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import EchoWorker
+from py_async.streams.core import FileFormat, TaskStatus
+from py_async.streams.input import FILE_STREAMS as INPUT_STREAMS, ICsv
+from py_async.streams.output import FILE_STREAMS as OUTPUT_STREAMS, OArrow, ODataset, OJsonLines, OParquet
+from py_async.worker import TaskResult
+
+ROWS = 2000
+INPUTS = ['csv', 'json', 'jsonl', 'parquet']
+OUTPUTS = ['csv', 'json', 'jsonl']
+
+
+def write_input(directory, fmt: str) -> str:
+    path = os.path.join(directory, f'in.{fmt}')
+    rows = [{'a': i, 'b': f'row {i}'} for i in range(ROWS)]
+    if fmt == 'parquet':
+        pq.write_table(pa.Table.from_pylist(rows), path, row_group_size=300)
+    elif fmt == 'csv':
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, ['a', 'b'])
+            writer.writeheader()
+            writer.writerows(rows)
+    elif fmt == 'json':
+        with open(path, 'w') as f:
+            json.dump(rows, f)
+    else:
+        with open(path, 'w') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+    return path
+
+
+def read_output(path: str, fmt: str) -> list:
+    if fmt == 'csv':
+        with open(path, newline='') as f:
+            return [int(row['a']) for row in csv.DictReader(f)]
+    if fmt == 'json':
+        with open(path) as f:
+            return [row['a'] for row in json.load(f)]
+    with open(path) as f:
+        return [json.loads(line)['a'] for line in f]
+
+
+def run_job(input_path: str, output_path: str, checkpoint_path: str, crash_at: int = 0):
+    """Pass the input through to the output, killing the process without cleanup at the `crash_at`th record."""
+    processed = 0
+
+    class CrashingWorker(EchoWorker):
+        async def process(self, data, context):
+            nonlocal processed
+            processed += 1
+            if processed == crash_at:
+                os._exit(1)
+            await asyncio.sleep(random.random() / 1000)
+            if data['a'] % 97 == 5:
+                raise RuntimeError('bad record')
+            return TaskResult(data, TaskStatus.COMPLETED)
+
+    input_stream = INPUT_STREAMS[FileFormat(input_path.rsplit('.', 1)[1])](input_path, maxsize=16)
+    output_stream = OUTPUT_STREAMS[FileFormat(output_path.rsplit('.', 1)[1])](output_path, force=True)
+    worker = CrashingWorker().input(input_stream).output(output_stream).checkpoint(checkpoint_path, interval=0.0)
+    asyncio.run(worker.run(4))
+
+
+def run_job_process(*args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.run([sys.executable, os.path.abspath(__file__), *map(str, args)], cwd=root,
+                          env={**os.environ, 'PYTHONPATH': root}, capture_output=True).returncode
+
+
+@pytest.mark.parametrize('output_format', OUTPUTS)
+@pytest.mark.parametrize('input_format', INPUTS)
+def test_crash_and_resume(tmp_path, input_format, output_format):
+    input_path = write_input(tmp_path, input_format)
+    output_path = str(tmp_path / f'out.{output_format}')
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+
+    assert run_job_process(input_path, output_path, checkpoint_path, 700) == 1
+    assert os.path.exists(checkpoint_path)
+    assert run_job_process(input_path, output_path, checkpoint_path, 1300) == 1
+    assert run_job_process(input_path, output_path, checkpoint_path, 0) == 0
+    assert not os.path.exists(checkpoint_path)
+
+    # Every record written exactly once, except the ones the worker failed on
+    assert sorted(read_output(output_path, output_format)) == [i for i in range(ROWS) if i % 97 != 5]
+
+
+def test_without_crash_removes_checkpoint(tmp_path):
+    input_path = write_input(tmp_path, 'csv')
+    output_path = str(tmp_path / 'out.jsonl')
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    run_job(input_path, output_path, checkpoint_path)
+    assert not os.path.exists(checkpoint_path)
+    assert len(read_output(output_path, 'jsonl')) == ROWS - len(range(5, ROWS, 97))
+
+
+class FailingOutput(OJsonLines):
+    """Fails the run with an unexpected exception after `fail_after` records."""
+
+    def __init__(self, *args, fail_after: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fail_after = fail_after
+
+    def write(self, record):
+        if self._fail_after == 0:
+            raise IOError('disk full')
+        self._fail_after -= 1
+        super().write(record)
+
+
+def test_failed_run_saves_checkpoint(tmp_path):
+    input_path = write_input(tmp_path, 'jsonl')
+    output_path = str(tmp_path / 'out.jsonl')
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    # A long interval, so only the failure saves the checkpoint
+    worker = EchoWorker().input(INPUT_STREAMS[FileFormat.JSONL](input_path, maxsize=16)) \
+        .output(FailingOutput(output_path, fail_after=900)).checkpoint(checkpoint_path, interval=3600)
+    asyncio.run(worker.run(4))
+    assert os.path.exists(checkpoint_path)
+    worker = EchoWorker().input(INPUT_STREAMS[FileFormat.JSONL](input_path, maxsize=16)) \
+        .output(OJsonLines(output_path)).checkpoint(checkpoint_path, interval=3600)
+    asyncio.run(worker.run(4))
+    assert not os.path.exists(checkpoint_path)
+    assert sorted(read_output(output_path, 'jsonl')) == list(range(ROWS))
+
+
+UNRESUMABLE_OUTPUTS = {
+    'parquet': lambda directory: OParquet(os.path.join(directory, 'out.parquet')),
+    'arrow': lambda directory: OArrow(os.path.join(directory, 'out.arrow')),
+    'dataset': lambda directory: ODataset(os.path.join(directory, 'out')),
+    'gzip': lambda directory: OJsonLines(os.path.join(directory, 'out.jsonl.gz')),
+    'background_upload': lambda directory: OJsonLines(os.path.join(directory, 'out.jsonl'), background_upload=True),
+}
+
+
+@pytest.mark.parametrize('output', list(UNRESUMABLE_OUTPUTS))
+def test_unresumable_output_fails_at_start(tmp_path, output):
+    processed = []
+    worker = EchoWorker(delay=lambda data: processed.append(data) or 0) \
+        .input(ICsv(write_input(tmp_path, 'csv'))) \
+        .output(UNRESUMABLE_OUTPUTS[output](str(tmp_path))) \
+        .checkpoint(str(tmp_path / 'checkpoint.json'))
+    with pytest.raises(ValueError):
+        asyncio.run(worker.run(4))
+    assert not processed
+
+
+if __name__ == '__main__':
+    run_job(sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]))
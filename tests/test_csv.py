@@ -0,0 +1,39 @@
+import pyarrow
+import pytest
+
+from py_async.streams.input import IArrowCsv, ICsv
+
+
+def write_csv(path: str, rows: int):
+    with open(path, 'w') as f:
+        f.write('a,b\n')
+        for i in range(rows):
+            f.write(f'{i},{"x" * (i % 7)}\n')
+
+
+def read_all(stream_class, path: str, num_shards: int, **kwargs) -> list:
+    rows = []
+    for shard_index in range(num_shards):
+        stream = stream_class(path, shard_index=shard_index, num_shards=num_shards, **kwargs)
+        stream.init_stream()
+        assert list(stream.get_columns()) == ['a', 'b']
+        rows += [int(row['a']) for row in stream]
+    return rows
+
+
+@pytest.mark.parametrize('stream_class', [ICsv, IArrowCsv])
+@pytest.mark.parametrize('rows, num_shards', [(100, 1), (100, 3), (2, 5)])
+def test_read_shards(tmp_path, stream_class, rows, num_shards):
+    path = str(tmp_path / 'in.csv')
+    write_csv(path, rows)
+    assert sorted(read_all(stream_class, path, num_shards)) == list(range(rows))
+
+
+def test_empty_shard_keeps_schema(tmp_path):
+    path = str(tmp_path / 'in.csv')
+    write_csv(path, 2)
+    schema = pyarrow.schema([('a', pyarrow.int32()), ('b', pyarrow.string())])
+    stream = IArrowCsv(path, shard_index=4, num_shards=5, schema=schema)
+    stream.init_stream()
+    assert stream.get_types() == {'a': pyarrow.int32(), 'b': pyarrow.string()}
+    assert list(stream) == []
@@ -0,0 +1,61 @@
+import hashlib
+import json
+
+import pyarrow.parquet as pq
+import pytest
+
+from py_async.streams.core import _choose_filesystem
+from py_async.streams.output import ODataset
+
+ROWS = 5000
+MAX_BYTES = 32 << 10
+
+
+def record(i: int) -> dict:
+    return {'a': i, 'p': i % 2, 'b': hashlib.md5(str(i).encode()).hexdigest()}
+
+
+def write_dataset(path: str, **kwargs) -> ODataset:
+    stream = ODataset(path, **kwargs)
+    stream.init_stream()
+    for i in range(ROWS):
+        stream.write(record(i))
+    stream.close()
+    return stream
+
+
+def read_manifest(path: str) -> dict:
+    fs = _choose_filesystem(path)
+    [manifest_path] = fs.glob(f'{path}/_manifest-*.json')
+    return json.loads(fs.cat_file(manifest_path))
+
+
+@pytest.mark.parametrize('file_format, options', [
+    ('jsonl', {'buffer_size': 4096}),
+    ('csv', {}),
+    ('parquet', {'batch_size': 256, 'row_group_size': 256}),
+    ('jsonl', {'buffer_size': 4096, 'background_upload': True, 'part_size': 8192}),
+])
+def test_max_bytes_per_file(tmp_path, file_format, options):
+    path = str(tmp_path / 'out')
+    stream = write_dataset(path, file_format=file_format, max_bytes_per_file=MAX_BYTES, options=options)
+    fs = _choose_filesystem(path)
+    manifest = read_manifest(path)
+    assert manifest['rows'] == ROWS
+    assert len(stream.files) == len(manifest['files']) > 2
+    for part in manifest['files']:
+        size = fs.size(f'{path}/{part["path"]}')
+        assert part['bytes'] == size
+        # Bytes are counted as written, so a part only exceeds the limit by what was still buffered
+        assert size < 2 * MAX_BYTES
+    # The sizes in memory of the records would be several times larger, and roll far earlier
+    assert sum(part['bytes'] for part in manifest['files'][:-1]) >= MAX_BYTES * (len(manifest['files']) - 1)
+
+
+def test_partitioned_parquet(tmp_path):
+    path = str(tmp_path / 'out')
+    write_dataset(path, partition_by='p', max_rows_per_file=1000)
+    manifest = read_manifest(path)
+    assert sorted(part['partition']['p'] for part in manifest['files']) == [0, 0, 0, 1, 1, 1]
+    table = pq.read_table(path)
+    assert sorted(table['a'].to_pylist()) == list(range(ROWS))
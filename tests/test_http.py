@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from py_async.http import HttpWorker
+from py_async.streams.core import TaskStatus
+from py_async.streams.input import IJsonLines
+from py_async.streams.output import OJsonLines
+from py_async.worker import TaskResult
+
+
+class ScoreWorker(HttpWorker):
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+
+    def build_request(self, data):
+        return {'method': 'POST', 'url': self.url, 'json': data}
+
+    async def parse_response(self, data, response):
+        if response.status != 200:
+            return TaskResult(data, TaskStatus.FAILED)
+        return TaskResult(await response.json(), TaskStatus.COMPLETED)
+
+
+def throttling_app(rejections: int, retry_after: str = '0') -> web.Application:
+    """Answers 429 with `Retry-After` to the first `rejections` requests for every record."""
+    attempts = Counter()
+
+    async def score(request):
+        data = await request.json()
+        attempts[data['a']] += 1
+        if attempts[data['a']] <= rejections:
+            return web.Response(status=429, headers={'Retry-After': retry_after})
+        return web.json_response({'a': data['a'], 'score': data['a'] * 2, 'attempts': attempts[data['a']]})
+
+    app = web.Application()
+    app.router.add_post('/score', score)
+    return app
+
+
+async def request_once(app: web.Application, data, **kwargs) -> TaskResult:
+    async with TestServer(app) as server:
+        worker = ScoreWorker(str(server.make_url('/score')), **kwargs)
+        await worker.start()
+        try:
+            return await worker.process(data, worker.worker_init())
+        finally:
+            await worker.stop()
+
+
+def test_retries_429():
+    result = asyncio.run(request_once(throttling_app(2), {'a': 1}, backoff=0.001))
+    assert result.status == TaskStatus.COMPLETED
+    assert result.data == {'a': 1, 'score': 2, 'attempts': 3}
+
+
+def test_retry_after_is_honoured():
+    start = time.monotonic()
+    result = asyncio.run(request_once(throttling_app(1, retry_after='0.3'), {'a': 1}, backoff=0.001))
+    assert result.status == TaskStatus.COMPLETED
+    assert time.monotonic() - start >= 0.3
+
+
+def test_gives_up_after_max_retries():
+    result = asyncio.run(request_once(throttling_app(10), {'a': 1}, backoff=0.001, max_retries=2))
+    assert result.status == TaskStatus.FAILED
+    assert result.data == {'a': 1}
+
+
+class StrictWorker(ScoreWorker):
+    async def parse_response(self, data, response):
+        response.raise_for_status()
+        return TaskResult(await response.json(), TaskStatus.COMPLETED)
+
+
+def test_parse_errors_are_not_retried():
+    requests = []
+
+    async def missing(request):
+        requests.append(request)
+        return web.Response(status=404)
+
+    async def run():
+        app = web.Application()
+        app.router.add_post('/score', missing)
+        async with TestServer(app) as server:
+            worker = StrictWorker(str(server.make_url('/score')), backoff=0.001, max_retries=3)
+            await worker.start()
+            try:
+                return await worker.process({'a': 1}, worker.worker_init())
+            finally:
+                await worker.stop()
+
+    result = asyncio.run(run())
+    assert result.status == TaskStatus.FAILED
+    assert result.data == {'a': 1}
+    assert len(requests) == 1
+
+
+def test_run(tmp_path):
+    source, target = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    source.write_text(''.join(json.dumps({'a': i}) + '\n' for i in range(200)))
+
+    async def run():
+        async with TestServer(throttling_app(1)) as server:
+            worker = ScoreWorker(str(server.make_url('/score')), backoff=0.001, limit=8)
+            await worker.input(IJsonLines(str(source))).output(OJsonLines(str(target))).run(16)
+
+    asyncio.run(run())
+    rows = [json.loads(line) for line in target.read_text().splitlines()]
+    assert sorted(row['a'] for row in rows) == list(range(200))
+    assert all(row['score'] == row['a'] * 2 and row['attempts'] == 2 for row in rows)
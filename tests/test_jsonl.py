@@ -0,0 +1,69 @@
+import gzip
+import json
+
+import pytest
+
+from py_async.streams.core import _choose_filesystem
+from py_async.streams.input import IDataset, IJsonLines
+
+ROWS = 1000
+
+
+def jsonl(rows, trailing_newline: bool = True) -> bytes:
+    data = ''.join(json.dumps({'a': i, 'b': 'x' * (i % 13)}) + ('\n\n' if i % 100 == 0 else '\n') for i in rows)
+    return (data if trailing_newline else data.rstrip('\n')).encode('utf-8')
+
+
+def read_all(path: str, num_shards: int = 1, **kwargs) -> list:
+    rows = []
+    for shard_index in range(num_shards):
+        stream = IJsonLines(path, shard_index=shard_index, num_shards=num_shards, **kwargs)
+        stream.init_stream()
+        rows += [row['a'] for row in stream]
+    return rows
+
+
+@pytest.fixture(params=['local', 's3'])
+def base_path(request, tmp_path) -> str:
+    if request.param == 'local':
+        return str(tmp_path)
+    return request.getfixturevalue('s3_path')
+
+
+@pytest.mark.parametrize('num_shards', [1, 3, 7])
+@pytest.mark.parametrize('trailing_newline', [True, False])
+def test_read(base_path, num_shards, trailing_newline):
+    path = f'{base_path}/in.jsonl'
+    _choose_filesystem(path).pipe_file(path, jsonl(range(ROWS), trailing_newline))
+    # Small chunks, so that lines span chunk boundaries
+    assert sorted(read_all(path, num_shards, chunk_size=100)) == list(range(ROWS))
+
+
+@pytest.mark.parametrize('num_shards', [1, 3])
+def test_read_compressed(base_path, num_shards):
+    path = f'{base_path}/in.jsonl.gz'
+    _choose_filesystem(path).pipe_file(path, gzip.compress(jsonl(range(ROWS))))
+    assert sorted(read_all(path, num_shards)) == list(range(ROWS))
+
+
+def test_resume(base_path):
+    path = f'{base_path}/in.jsonl'
+    _choose_filesystem(path).pipe_file(path, jsonl(range(ROWS)))
+    stream = IJsonLines(path)
+    stream.track_positions()
+    stream.init_stream()
+    first = [next(stream)['a'] for _ in range(400)]
+    resumed = IJsonLines(path, chunk_size=64)
+    resumed.seek(stream.position)
+    resumed.init_stream()
+    assert first + [row['a'] for row in resumed] == list(range(ROWS))
+
+
+def test_dataset_prefix(s3_path):
+    fs = _choose_filesystem(s3_path)
+    for part in range(4):
+        fs.pipe_file(f'{s3_path}/part-{part}.jsonl', jsonl(range(part * 250, (part + 1) * 250)))
+    fs.pipe_file(f'{s3_path}/_SUCCESS', b'')
+    stream = IDataset(f'{s3_path}/', max_open_files=2)
+    stream.init_stream()
+    assert sorted(row['a'] for row in stream) == list(range(ROWS))
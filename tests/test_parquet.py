@@ -0,0 +1,31 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from py_async.streams.output import OParquet
+
+ROWS = 3000
+
+
+@pytest.mark.parametrize('batch_size, row_group_size', [(1024, 100), (100, 1024), (7, 5)])
+def test_rows_stay_in_order(tmp_path, batch_size, row_group_size):
+    path = str(tmp_path / 'out.parquet')
+    stream = OParquet(path, batch_size=batch_size, row_group_size=row_group_size)
+    for i in range(ROWS):
+        stream.write({'id': i})
+    stream.close()
+    file = pq.ParquetFile(path)
+    assert file.read()['id'].to_pylist() == list(range(ROWS))
+    assert max(file.metadata.row_group(i).num_rows for i in range(file.num_row_groups)) <= row_group_size
+
+
+def test_batches_and_dicts_stay_in_order(tmp_path):
+    path = str(tmp_path / 'out.parquet')
+    stream = OParquet(path, batch_size=1024, row_group_size=100)
+    for i in range(0, ROWS, 1000):
+        for j in range(i, i + 500):
+            stream.write({'id': j})
+        # A batch larger than a row group leaves rows behind in the buffer
+        stream.write(pa.record_batch({'id': pa.array(range(i + 500, i + 1000), pa.int64())}))
+    stream.close()
+    assert pq.read_table(path)['id'].to_pylist() == list(range(ROWS))
@@ -0,0 +1,138 @@
+import asyncio
+import gc
+import json
+import os
+
+import pytest
+import s3fs
+
+from conftest import EchoWorker
+from py_async.streams.input import IJsonLines
+
+from py_async.streams.core import _choose_filesystem
+from py_async.streams.output import OJsonLines
+from py_async.streams.upload import MIN_PART_SIZE, S3MultipartWriter, ThreadedWriter, open_background_writer
+
+
+def pending_uploads(client, fs, path: str) -> list:
+    bucket, prefix, _ = fs.split_path(path)
+    return client.list_multipart_uploads(Bucket=bucket, Prefix=prefix).get('Uploads', [])
+
+
+def test_multipart_upload(s3_server, s3_path):
+    fs = _choose_filesystem(s3_path)
+    data = os.urandom(MIN_PART_SIZE * 2 + 12345)
+    writer = open_background_writer(fs, f'{s3_path}/data.bin', MIN_PART_SIZE, 2)
+    assert isinstance(writer, S3MultipartWriter)
+    for i in range(0, len(data), 1 << 20):
+        writer.write(data[i:i + (1 << 20)])
+    assert writer.tell() == len(data)
+    writer.close()
+    assert fs.cat_file(f'{s3_path}/data.bin') == data
+    # Three parts, the last one shorter
+    bucket, key, _ = fs.split_path(f'{s3_path}/data.bin')
+    assert s3_server.head_object(Bucket=bucket, Key=key)['ETag'].endswith('-3"')
+
+
+def test_small_file_is_a_single_put(s3_server, s3_path):
+    fs = _choose_filesystem(s3_path)
+    writer = open_background_writer(fs, f'{s3_path}/small.bin', MIN_PART_SIZE, 2)
+    writer.write(b'small')
+    writer.close()
+    assert fs.cat_file(f'{s3_path}/small.bin') == b'small'
+
+
+def test_part_size_below_s3_minimum(s3_server, s3_path):
+    with pytest.raises(ValueError):
+        open_background_writer(_choose_filesystem(s3_path), f'{s3_path}/data.bin', 1 << 20, 2)
+
+
+def test_failed_part_aborts_upload(s3_server, s3_path, monkeypatch):
+    fs = _choose_filesystem(s3_path)
+    upload_part = S3MultipartWriter._upload_part
+
+    def fail_second_part(self, part_number, data):
+        if part_number == 2:
+            raise IOError('connection reset')
+        return upload_part(self, part_number, data)
+
+    monkeypatch.setattr(S3MultipartWriter, '_upload_part', fail_second_part)
+    writer = open_background_writer(fs, f'{s3_path}/data.bin', MIN_PART_SIZE, 2)
+    writer.write(os.urandom(MIN_PART_SIZE * 3))
+    with pytest.raises(IOError):
+        writer.close()
+    assert not fs.exists(f'{s3_path}/data.bin')
+    assert not pending_uploads(s3_server, fs, s3_path)
+
+
+def test_threaded_writer(tmp_path):
+    path = str(tmp_path / 'data.bin')
+    writer = open_background_writer(_choose_filesystem(path), path, 1 << 10, 4)
+    assert isinstance(writer, ThreadedWriter)
+    data = os.urandom(10_000)
+    writer.write(data)
+    writer.close()
+    assert open(path, 'rb').read() == data
+
+
+def test_output_stream_background_upload(s3_server, s3_path):
+    stream = OJsonLines(f'{s3_path}/out.jsonl', background_upload=True, part_size=MIN_PART_SIZE)
+    stream.init_stream()
+    for i in range(1000):
+        stream.write({'a': i})
+    stream.close()
+    lines = s3fs.S3FileSystem().cat_file(f'{s3_path}/out.jsonl').splitlines()
+    assert len(lines) == 1000
+
+
+def test_abort(s3_server, s3_path):
+    fs = _choose_filesystem(s3_path)
+    writer = open_background_writer(fs, f'{s3_path}/data.bin', MIN_PART_SIZE, 2)
+    writer.write(os.urandom(MIN_PART_SIZE * 2 + 1))
+    writer.abort()
+    assert writer.closed
+    assert not fs.exists(f'{s3_path}/data.bin')
+    assert not pending_uploads(s3_server, fs, s3_path)
+    with pytest.raises(ValueError):
+        writer.write(b'more')
+
+
+def test_unclosed_output_is_aborted(s3_server, s3_path):
+    fs = _choose_filesystem(s3_path)
+    stream = OJsonLines(f'{s3_path}/data.jsonl', background_upload=True, part_size=MIN_PART_SIZE)
+    stream.init_stream()
+    for i in range(1200):
+        stream.write({'a': i, 'blob': 'x' * 10_000})
+    del stream
+    gc.collect()
+    assert not fs.exists(f'{s3_path}/data.jsonl')
+    assert not pending_uploads(s3_server, fs, s3_path)
+
+
+class FailingOutput(OJsonLines):
+    """Fails the run once `fail_after` records have been written."""
+
+    def __init__(self, *args, fail_after: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fail_after = fail_after
+        self._written = 0
+
+    def write(self, record):
+        self._written += 1
+        if self._written > self._fail_after:
+            raise IOError('disk full')
+        super().write(record)
+
+
+def test_failed_run_does_not_commit_upload(s3_server, s3_path, tmp_path):
+    source = tmp_path / 'in.jsonl'
+    source.write_text(''.join(json.dumps({'a': i, 'blob': 'x' * 10_000}) + '\n' for i in range(2000)))
+    output = FailingOutput(f'{s3_path}/out.jsonl', background_upload=True, part_size=MIN_PART_SIZE,
+                           buffer_size=1 << 16, fail_after=1500)
+    worker = EchoWorker().input(IJsonLines(str(source))).output(output)
+    asyncio.run(worker.run(4))
+    fs = _choose_filesystem(s3_path)
+    # More than two parts had been uploaded when the run failed
+    assert output._upload.tell() > 2 * MIN_PART_SIZE
+    assert not fs.exists(f'{s3_path}/out.jsonl')
+    assert not pending_uploads(s3_server, fs, s3_path)